@@ -19,9 +19,16 @@ if __name__ == "__main__":
     # Get Questionaries paths
     VISIA_Q_PATH = os.getenv("QUESTIONARIES_PATH")
     VISIA_Q_PROCESS_PATH = os.getenv("QUESTIONARIES_PROCESS_PATH")
+    VISIA_Q_CSV_ENGINE = os.getenv("QUESTIONARIES_CSV_ENGINE")
+    VISIA_Q_MAX_WORKERS = int(os.getenv("QUESTIONARIES_MAX_WORKERS", 1))
     # Get Video paths
     VISIA_V_PATH = os.getenv("VIDEO_PATH")
     VISIA_V_PROCESS_PATH = os.getenv("VIDEO_PROCESS_PATH")
+    VISIA_V_WORKERS = int(os.getenv("VIDEO_WORKERS", 1))
+    VISIA_V_WHISPER_MODEL = os.getenv("WHISPER_MODEL")
+    VISIA_V_TRANSCRIBE = os.getenv("TRANSCRIBE_VIDEOS", "false").lower() == "true"
+    # Format of the processed tables: csv (default), parquet or feather
+    OUTPUT_FORMAT = os.getenv("OUTPUT_FORMAT", "csv")
 
     app_logger.info(f"Starting pipeline for {EXP_PATH}")
     visia_q_processed = visia_questionaries_pipeline(
@@ -29,11 +36,19 @@ if __name__ == "__main__":
         q_path=VISIA_Q_PATH,
         config_path=CONFIG_PATH,
         q_process_path=VISIA_Q_PROCESS_PATH,
+        output_format=OUTPUT_FORMAT,
+        csv_engine=VISIA_Q_CSV_ENGINE,
+        max_workers=VISIA_Q_MAX_WORKERS,
     )
 
     app_logger.info("Starting video pipeline")
     visia_v_processed = pipeline_videos(
-        path_to_raw_video=VISIA_V_PATH, path_to_save_processed_video=VISIA_V_PROCESS_PATH
+        path_to_raw_video=VISIA_V_PATH,
+        path_to_save_processed_video=VISIA_V_PROCESS_PATH,
+        workers=VISIA_V_WORKERS,
+        whisper_model_name=VISIA_V_WHISPER_MODEL,
+        transcribe=VISIA_V_TRANSCRIBE,
+        output_format=OUTPUT_FORMAT,
     )
 
     app_logger.info("Merging processed questionaries and videos")
@@ -41,5 +56,6 @@ if __name__ == "__main__":
         processed_q=visia_q_processed,
         processed_v=visia_v_processed,
         path_to_save=VISIA_Q_PROCESS_PATH,
+        output_format=OUTPUT_FORMAT,
     )
     app_logger.info("Pipeline finished")
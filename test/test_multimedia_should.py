@@ -1,12 +1,31 @@
+import asyncio
 import os
+import subprocess
+import sys
 from pathlib import Path
+from unittest import mock
 
+import ffmpeg
+import librosa
+import numpy as np
 import pandas as pd
 import pytest
 import torchaudio
 
 from test import ROOT_TEST_PATH
-from visia_science.data.multimedia import Multimedia
+from visia_science.data.multimedia import (
+    AudioObject,
+    Multimedia,
+    VideoObject,
+    calculate_frame_rms_and_zcr,
+    clear_probe_cache,
+    load_whisper_model,
+    probe_media,
+    probe_media_async,
+    probe_media_batch_async,
+    transcribe_multimedia_batch,
+)
+from visia_science.data.multimedia_index import MetadataCheckpoint, MultimediaMetadataIndex
 
 
 class TestQuestionaryShould:
@@ -62,6 +81,66 @@ class TestQuestionaryShould:
             assert audio.is_multimedia()
             assert audio.is_audio()
 
+    def test_probe_media_is_cached_should(self, yesno_file_paths):
+        # Arrange
+        for file_path in yesno_file_paths:
+            # Act
+            first_probe = probe_media(file_path)
+            second_probe = probe_media(file_path)
+
+            # Assert
+            assert first_probe is second_probe
+
+    def test_probe_media_batch_async_should(self, yesno_file_paths):
+        # Act
+        probes = asyncio.run(probe_media_batch_async(yesno_file_paths, max_concurrent_probes=4))
+
+        # Assert
+        assert len(probes) == len(yesno_file_paths)
+        for file_path, probe in zip(yesno_file_paths, probes):
+            assert probe == probe_media(file_path)
+
+    def test_metadata_index_should(self, yesno_file_paths):
+        # Arrange
+        metadata_index = MultimediaMetadataIndex(
+            os.path.join(self.temp_folder, "metadata_index.sqlite")
+        )
+        for file_path in yesno_file_paths:
+            audio = Multimedia(
+                path_to_raw_data=file_path,
+                path_to_save_data=self.temp_folder)
+            audio.load_metadata()
+
+            # Act
+            metadata_index.set_metadata(file_path, audio.multimedia_metadata)
+            indexed_metadata = metadata_index.get_metadata(file_path)
+            Path(file_path).touch()
+            touched_metadata = metadata_index.get_metadata(file_path)
+
+            # Assert
+            assert indexed_metadata == audio.multimedia_metadata
+            assert touched_metadata is None
+
+        metadata_index.close()
+
+    def test_resume_from_metadata_checkpoint_should(self, yesno_file_paths):
+        # Arrange
+        path_to_checkpoint = os.path.join(self.temp_folder, "metadata.checkpoint.jsonl")
+        checkpoint = MetadataCheckpoint(path_to_checkpoint, batch_size=2)
+        for file_path in yesno_file_paths:
+            checkpoint.add_record(file_path, {"path": file_path})
+        with open(path_to_checkpoint, "a") as file:
+            file.write('{"file_path": "truncated')
+
+        # Act
+        checkpoint_records = MetadataCheckpoint(path_to_checkpoint).load_records()
+        checkpoint.remove()
+
+        # Assert
+        assert len(checkpoint_records) == 2 * (len(yesno_file_paths) // 2)
+        assert all(record == {"path": path} for path, record in checkpoint_records.items())
+        assert not os.path.exists(path_to_checkpoint)
+
     def test_load_a_multimedia_should(self, yesno_file_paths):  # Inject the fixture
         # Arrange
         for file_path in yesno_file_paths:
@@ -75,6 +154,36 @@ class TestQuestionaryShould:
             # Assert
             assert load_audio_response.success is True
 
+    def test_decode_audio_on_first_access_should(self, yesno_file_paths):
+        # Arrange
+        for file_path in yesno_file_paths:
+            audio = Multimedia(
+                path_to_raw_data=file_path,
+                path_to_save_data=self.temp_folder)
+            audio.load_multimedia()
+
+            # Act and Assert
+            assert audio.audio_data is not None
+            assert audio.video_data is None
+
+            audio.release_multimedia()
+            assert audio._audio_data is None
+
+    def test_decode_audio_at_target_sample_rate_should(self, yesno_file_paths):
+        # Arrange
+        for file_path in yesno_file_paths:
+            audio = Multimedia(
+                path_to_raw_data=file_path,
+                path_to_save_data=self.temp_folder,
+                audio_sample_rate=16000)
+
+            # Act
+            audio.load_multimedia()
+
+            # Assert
+            assert audio.audio_data.dtype == np.float32
+            assert audio.audio_data.ndim == 1
+
     def test_calculate_audio_quality(self, yesno_file_paths):
         # Arrange
         for file_path in yesno_file_paths:
@@ -94,6 +203,47 @@ class TestQuestionaryShould:
                 quality_parameter = audio_quality_data[key]
                 assert quality_parameter is not None
 
+    def test_calculate_audio_quality_in_blocks_should(self, yesno_file_paths):
+        # Arrange
+        for file_path in yesno_file_paths:
+            audio = Multimedia(
+                path_to_raw_data=file_path,
+                path_to_save_data=self.temp_folder)
+            audio_quality = audio.calculate_audio_quality().data
+
+            # Act
+            streaming_audio_quality = audio.calculate_audio_quality(
+                streaming=True, block_duration_s=1.0
+            ).data
+
+            # Assert
+            assert streaming_audio_quality.keys() == audio_quality.keys()
+            assert np.isclose(
+                streaming_audio_quality["audio-ZCR_avg"], audio_quality["audio-ZCR_avg"]
+            )
+            assert np.isclose(
+                streaming_audio_quality["audio-SNR(dB)"], audio_quality["audio-SNR(dB)"], atol=0.1
+            )
+
+    def test_frame_rms_and_zcr_match_librosa_should(self, yesno_file_paths):
+        # Arrange
+        for file_path in yesno_file_paths:
+            audio = Multimedia(
+                path_to_raw_data=file_path,
+                path_to_save_data=self.temp_folder)
+            audio_data = audio.audio_data
+
+            # Act
+            rms, zcr = calculate_frame_rms_and_zcr(audio_data, frame_length=400, hop_length=160)
+
+            # Assert
+            expected_rms = librosa.feature.rms(y=audio_data, frame_length=400, hop_length=160)
+            expected_zcr = librosa.feature.zero_crossing_rate(
+                audio_data, frame_length=400, hop_length=160
+            )
+            assert np.allclose(rms, expected_rms[0], atol=1e-5)
+            assert np.allclose(zcr, expected_zcr[0])
+
     def test_transcribe_multimedia_should(self, yesno_file_paths):  # Inject the fixture
         # Arrange
         for file_path in yesno_file_paths:
@@ -112,6 +262,47 @@ class TestQuestionaryShould:
             assert transcription is not None
             assert len(transcription) > 0
 
+    def test_transcribe_from_cache_should(self, yesno_file_paths):
+        # Arrange
+        path_to_transcription_cache = os.path.join(self.temp_folder, "transcriptions.sqlite")
+        for file_path in yesno_file_paths:
+            audio = Multimedia(
+                path_to_raw_data=file_path,
+                path_to_save_data=self.temp_folder,
+                path_to_transcription_cache=path_to_transcription_cache)
+            first_response = audio.transcribe(language="en")
+
+            # Act
+            second_response = audio.transcribe(language="en")
+
+            # Assert
+            assert second_response.success is True
+            assert second_response.data.get("text") == first_response.data.get("text")
+
+    def test_transcribe_multimedia_batch_should(self, yesno_file_paths):
+        # Arrange
+        audios = [
+            Multimedia(path_to_raw_data=file_path, path_to_save_data=self.temp_folder)
+            for file_path in yesno_file_paths
+        ]
+
+        # Act
+        transcribe_batch_response = transcribe_multimedia_batch(audios, language="en")
+
+        # Assert
+        assert transcribe_batch_response.success is True
+        assert len(transcribe_batch_response.data) == len(audios)
+        for audio in audios:
+            assert audio.multimedia_metadata.get("transcription") is not None
+
+    def test_load_whisper_model_once_should(self):
+        # Act
+        first_model = load_whisper_model("base.en")
+        second_model = load_whisper_model("base.en")
+
+        # Assert
+        assert first_model is second_model
+
     def test_multimedia_as_questionary_should(self, yesno_file_paths):
         # Arrange
         for file_path in yesno_file_paths:
@@ -131,6 +322,193 @@ class TestQuestionaryShould:
             assert isinstance(audio_as_questionary_response.data, pd.DataFrame)
 
 
+
+class TestMultimediaMetadataIndexShould:
+    def test_detect_a_file_modified_in_place_should(self, tmp_path):
+        # Arrange
+        file_path = tmp_path / "video.mp4"
+        file_path.write_bytes(b"head" + b"a" * (3 * 1024 * 1024) + b"tail")
+        metadata_index = MultimediaMetadataIndex(str(tmp_path / "metadata_index.sqlite"))
+        metadata_index.set_metadata(str(file_path), {"file_id": "video"})
+
+        # Act
+        with open(file_path, "r+b") as file:
+            file.seek(1024 * 1024 + 512)
+            file.write(b"b" * 1024)
+        os.utime(file_path, ns=(file_path.stat().st_atime_ns, file_path.stat().st_mtime_ns + 1))
+        modified_metadata = metadata_index.get_metadata(str(file_path))
+        metadata_index.set_metadata(str(file_path), {"file_id": "video-fixed"})
+        indexed_metadata = metadata_index.get_metadata(str(file_path))
+        metadata_index.close()
+
+        # Assert
+        assert modified_metadata is None
+        assert indexed_metadata == {"file_id": "video-fixed"}
+
+
+class TestProbeMediaShould:
+    def test_raise_a_new_error_for_a_cached_probe_error_should(self, tmp_path):
+        # Arrange
+        file_path = tmp_path / "corrupted.mp4"
+        file_path.write_bytes(b"not a real video")
+        probe_error = ffmpeg.Error("ffprobe", b"", b"Invalid data found when processing input")
+        ffprobe_process = mock.MagicMock(returncode=1)
+        ffprobe_process.communicate = mock.AsyncMock(return_value=(probe_error.stdout, probe_error.stderr))
+        clear_probe_cache()
+
+        # Act
+        raised_errors = []
+        with mock.patch("visia_science.data.multimedia.ffmpeg.probe", side_effect=probe_error) as ffmpeg_probe:
+            for _ in range(2):
+                with pytest.raises(ffmpeg.Error) as error_info:
+                    probe_media(file_path)
+                raised_errors.append(error_info.value)
+        clear_probe_cache()
+        with mock.patch("asyncio.create_subprocess_exec", mock.AsyncMock(return_value=ffprobe_process)):
+            for _ in range(2):
+                with pytest.raises(ffmpeg.Error) as error_info:
+                    asyncio.run(probe_media_async(file_path))
+                raised_errors.append(error_info.value)
+        clear_probe_cache()
+
+        # Assert, ffprobe runs once per file and every raise gets its own error, so no traceback is kept in the cache
+        ffmpeg_probe.assert_called_once()
+        ffprobe_process.communicate.assert_called_once()
+        assert len({id(raised_error) for raised_error in raised_errors + [probe_error]}) == 5
+        assert all(raised_error.stderr == probe_error.stderr for raised_error in raised_errors)
+
+
+def start_fake_ffmpeg(stdout_size: int, stderr_size: int, return_code: int = 0) -> subprocess.Popen:
+    """Start a process that writes to stderr before it writes to stdout, as ffmpeg does with a corrupt file."""
+    script = (
+        "import sys\n"
+        f"sys.stderr.buffer.write(b'e' * {stderr_size})\n"
+        "sys.stderr.flush()\n"
+        f"sys.stdout.buffer.write(bytes(range(256)) * ({stdout_size} // 256))\n"
+        f"sys.exit({return_code})\n"
+    )
+    return subprocess.Popen(
+        [sys.executable, "-c", script], stdout=subprocess.PIPE, stderr=subprocess.PIPE
+    )
+
+
+class TestFfmpegPipeShould:
+    @staticmethod
+    def mock_ffmpeg_run_async(process: subprocess.Popen):
+        ffmpeg_input = mock.MagicMock()
+        ffmpeg_input.return_value.output.return_value.global_args.return_value.run_async.return_value = process
+        return mock.patch("visia_science.data.multimedia.ffmpeg.input", ffmpeg_input)
+
+    @staticmethod
+    def create_video_object(width: int, height: int) -> VideoObject:
+        video_object = VideoObject.__new__(VideoObject)
+        video_object.file_path = "video.mp4"
+        video_object.video_stream = {"width": width, "height": height}
+        return video_object
+
+    def test_iter_video_frames_in_batches_should(self):
+        # Arrange
+        video_object = self.create_video_object(width=4, height=4)
+        frame_size = 4 * 4 * 3
+        process = start_fake_ffmpeg(stdout_size=256 * frame_size, stderr_size=200 * 1024)
+
+        # Act
+        with self.mock_ffmpeg_run_async(process):
+            batches = [batch.copy() for batch in video_object.iter_video_frames(batch_size=100)]
+
+        # Assert
+        assert [len(batch) for batch in batches] == [100, 100, 56]
+        assert np.concatenate(batches).tobytes() == bytes(range(256)) * frame_size
+        assert process.returncode == 0
+
+    def test_iter_video_frames_raises_when_ffmpeg_fails_should(self):
+        # Arrange
+        video_object = self.create_video_object(width=4, height=4)
+        process = start_fake_ffmpeg(stdout_size=256 * 48, stderr_size=200 * 1024, return_code=1)
+
+        # Act & Assert
+        with self.mock_ffmpeg_run_async(process):
+            with pytest.raises(RuntimeError, match="Error converting video to ndarray"):
+                for _ in video_object.iter_video_frames(batch_size=100):
+                    pass
+
+    def test_stop_ffmpeg_when_iteration_is_left_should(self):
+        # Arrange
+        video_object = self.create_video_object(width=4, height=4)
+        process = start_fake_ffmpeg(stdout_size=256 * 48 * 100, stderr_size=200 * 1024)
+
+        # Act
+        with self.mock_ffmpeg_run_async(process):
+            video_frames = video_object.iter_video_frames(batch_size=1)
+            first_batch = next(video_frames)
+            video_frames.close()
+
+        # Assert
+        assert first_batch.shape == (1, 4, 4, 3)
+        assert process.returncode is not None
+
+    def test_iter_audio_blocks_should(self):
+        # Arrange
+        audio_object = AudioObject.__new__(AudioObject)
+        audio_object.file_path = "audio.wav"
+        audio_object.sample_rate = 16000
+        process = start_fake_ffmpeg(stdout_size=256 * 40, stderr_size=200 * 1024)
+
+        # Act
+        with self.mock_ffmpeg_run_async(process):
+            blocks = [block.copy() for block in audio_object.iter_audio_blocks(block_size=1000)]
+
+        # Assert
+        assert [len(block) for block in blocks] == [1000, 1000, 560]
+        assert np.concatenate(blocks).tobytes() == bytes(range(256)) * 40
+
+
+class TestTranscribeShould:
+    def test_decode_the_audio_once_to_transcribe_and_cache_should(self, tmp_path):
+        # Arrange
+        audio = Multimedia(
+            path_to_raw_data=tmp_path / "audio.wav",
+            path_to_transcription_cache=tmp_path / "transcriptions.sqlite",
+        )
+        audio.multimedia_metadata = {"audio-sample_rate": 16000}
+        audio.audio_data = np.random.default_rng(0).uniform(-1, 1, 16000).astype(np.float32)
+        whisper_model = mock.MagicMock()
+        whisper_model.transcribe.return_value = {"text": "hola", "language": "es"}
+
+        # Act
+        with mock.patch("visia_science.data.multimedia.load_whisper_model", return_value=whisper_model):
+            first_response = audio.transcribe()
+            second_response = audio.transcribe()
+
+        # Assert
+        whisper_model.transcribe.assert_called_once()
+        assert whisper_model.transcribe.call_args.args[0] is audio.audio_data
+        assert first_response.data == second_response.data == {"text": "hola", "language": "es"}
+        assert audio.multimedia_metadata["transcription"] == "hola"
+
+    def test_decode_the_audio_at_the_whisper_sample_rate_should(self, tmp_path):
+        # Arrange, the audio of the file is not decoded yet and its sample rate is not the one of whisper
+        audio = Multimedia(path_to_raw_data=tmp_path / "audio.wav")
+        audio.multimedia_metadata = {"audio-sample_rate": 44100}
+        audio_object = mock.MagicMock()
+        audio_object.audio_data = np.zeros(16000, dtype=np.float32)
+        whisper_model = mock.MagicMock()
+        whisper_model.transcribe.return_value = {"text": "hola", "language": "es"}
+
+        # Act
+        with mock.patch.object(Multimedia, "is_multimedia", return_value=True), \
+                mock.patch("visia_science.data.multimedia.AudioObject", return_value=audio_object) as audio_object_class, \
+                mock.patch("visia_science.data.multimedia.librosa.resample") as resample, \
+                mock.patch("visia_science.data.multimedia.load_whisper_model", return_value=whisper_model):
+            audio.transcribe()
+
+        # Assert, ffmpeg decodes it at 16 kHz instead of resampling the audio of the file
+        audio_object_class.assert_called_once_with(audio.path_to_raw_data, sample_rate=16000)
+        resample.assert_not_called()
+        assert whisper_model.transcribe.call_args.args[0] is audio_object.audio_data
+        assert audio.multimedia_metadata["transcription_model"] == "large"
+
+
 if __name__ == "__main__":
     # Run all tests in the module
     pytest.main()
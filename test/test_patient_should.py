@@ -0,0 +1,61 @@
+import numpy as np
+import pandas as pd
+
+from visia_science.data.patient import (
+    EDUCATION_NORMALIZER,
+    Patient,
+    PatientTable,
+    SEX_NORMALIZER,
+    VISIA_GROUP_NORMALIZER,
+    return_education_level,
+    return_sex,
+    return_visia_group,
+)
+
+
+class TestPatientShould:
+
+    def test_normalize_one_answer_should(self):
+        # Act & Assert
+        assert return_visia_group("g2") == "G2-clínico-N"
+        assert return_visia_group("G3-general") == "G3-general"
+        assert return_visia_group("other") == "UNK"
+        assert return_education_level("Secundaria") == "2-SECUNDARIA"
+        assert return_education_level(None) == "UNK"
+        assert return_sex("Mujer") == "MUJER"
+        assert return_sex("hombre") == "HOMBRE"
+
+    def test_normalize_a_column_of_answers_should(self):
+        # Arrange
+        answers = pd.Series(["g1", "G1", None, "other", "g3"], index=[10, 11, 12, 13, 14], name="group")
+
+        # Act
+        normalized_answers = VISIA_GROUP_NORMALIZER.normalize_series(answers)
+
+        # Assert
+        assert isinstance(normalized_answers.dtype, pd.CategoricalDtype)
+        assert normalized_answers.index.tolist() == [10, 11, 12, 13, 14]
+        assert normalized_answers.name == "group"
+        assert normalized_answers.tolist() == ["G1-clínico-S", "G1-clínico-S", "UNK", "UNK", "G3-general"]
+        assert SEX_NORMALIZER.normalize_series(pd.Series(["mujer", "Hombre"])).tolist() == ["MUJER", "HOMBRE"]
+        assert EDUCATION_NORMALIZER.normalize_series(pd.Series(["primaria"])).tolist() == ["1-PRIMARIA"]
+
+    def test_store_patients_in_a_table_should(self):
+        # Arrange
+        patients = [Patient(id=f"CUNQ-00{i}", age=20 + i, sex="MUJER", education_level="1-PRIMARIA",
+                            clinical_group="G3-general", city="Vigo", diagnosis="None", treatment="None",
+                            saliva_sample=i % 2 == 0) for i in range(3)]
+
+        # Act
+        patient_table = PatientTable.from_patients(patients)
+        df_patients = patient_table.to_dataframe()
+
+        # Assert
+        assert len(patient_table) == 3
+        assert list(patient_table) == ["CUNQ-000", "CUNQ-001", "CUNQ-002"]
+        assert patient_table["CUNQ-001"] == patients[1]
+        assert "unknown" not in patient_table
+        assert df_patients.index.tolist() == ["CUNQ-000", "CUNQ-001", "CUNQ-002"]
+        assert isinstance(df_patients["sex"].dtype, pd.CategoricalDtype)
+        assert np.shares_memory(df_patients["age"].to_numpy(), patient_table.to_dataframe()["age"].to_numpy())
+        assert df_patients["age"].tolist() == [20, 21, 22]
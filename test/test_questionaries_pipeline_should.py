@@ -0,0 +1,144 @@
+import numpy as np
+import pandas as pd
+
+from visia_science.data.patient import Patient
+from visia_science.data.questionary import VisiaQuestionary
+from visia_science.pipelines.questionaries import (
+    integrate_questionaries_with_patients,
+    pipeline_get_visia_patients,
+)
+
+
+def mock_a_questionary(path_to_questionary, q_name: str, df_responses: pd.DataFrame) -> VisiaQuestionary:
+    visia_q = VisiaQuestionary(q_file_name_to_search=path_to_questionary / q_name,
+                               q_name=q_name,
+                               column_with_id="id",
+                               column_with_date="date",
+                               columns_with_items=["item"],
+                               columns_with_scores=["score"])
+    visia_q.df_post_processed_data = df_responses
+    return visia_q
+
+
+def mock_the_patients_questionary(path_to_questionary, ids: list, birth_dates: list) -> VisiaQuestionary:
+    visia_q = mock_a_questionary(path_to_questionary, "VSC", pd.DataFrame({
+        "id": ids,
+        "Fecha de nacimiento": birth_dates,
+        "Nivel educativo": ["primaria", "Secundaria", "otro"][:len(ids)],
+        "Grupo clínico": ["G1", "g3-general", None][:len(ids)],
+        "Sexo (biológico)": ["Mujer", "hombre", "mujer"][:len(ids)],
+        "Checkbox": ["saliva", "", "saliva"][:len(ids)],
+        "Ciudad": ["Vigo", "Madrid", "Vigo"][:len(ids)],
+        "Diagnóstico": ["None", "TDAH", "None"][:len(ids)],
+        "Tratamiento": ["None", "None", "None"][:len(ids)],
+    }))
+    visia_q.path_to_save_data = path_to_questionary
+    return visia_q
+
+
+def years_ago(years: int) -> pd.Timestamp:
+    return pd.Timestamp.now() - pd.DateOffset(years=years, days=10)
+
+
+def mock_a_patient(id_patient: str, age: int) -> Patient:
+    return Patient(id=id_patient, age=age, sex="MUJER", education_level="1-PRIMARIA", clinical_group="G3-general",
+                   city="Vigo", diagnosis="None", treatment="None", saliva_sample=True)
+
+
+class TestQuestionariesPipelineShould:
+
+    def test_integrate_questionaries_with_patients_should(self, tmp_path):
+        # Arrange
+        patients = {patient.id: patient for patient in
+                    [mock_a_patient("CUNQ-001", 20), mock_a_patient("CUNQ-002", 30), mock_a_patient("CUNQ-003", 40)]}
+        # CUNQ-002 is missing from the first questionary, CUNQ-003 from all of them and CUNQ-009 is not a patient
+        questionaries = {
+            "Q1": mock_a_questionary(tmp_path, "Q1", pd.DataFrame({
+                "id": ["CUNQ-001", "CUNQ-001", "CUNQ-009"], "item": ["yes", "no", "yes"], "score": [1.0, 2.0, 3.0]})),
+            "Q2": mock_a_questionary(tmp_path, "Q2", pd.DataFrame({
+                "id": ["CUNQ-002", "CUNQ-001"], "item": ["no", None], "score": [5.0, np.nan]})),
+        }
+
+        # Act
+        df_integrated = integrate_questionaries_with_patients(patients, questionaries)
+
+        # Assert
+        assert df_integrated.to_dict(orient="list") == {
+            "id": ["CUNQ-001", "CUNQ-002"],
+            "age": [20, 30],
+            "sex": ["MUJER", "MUJER"],
+            "education_level": ["1-PRIMARIA", "1-PRIMARIA"],
+            "clinical_group": ["G3-general", "G3-general"],
+            "city": ["Vigo", "Vigo"],
+            "diagnosis": ["None", "None"],
+            "treatment": ["None", "None"],
+            "saliva_sample": [True, True],
+            "Q1 - item": ["yes", "No answer"],
+            "Q1 - score": [1.0, 0.0],
+            "Q2 - item": ["No answer", "no"],
+            "Q2 - score": [0.0, 5.0],
+        }
+        assert df_integrated["age"].dtype == np.int64
+        assert df_integrated["saliva_sample"].dtype == bool
+        assert isinstance(df_integrated["sex"].dtype, pd.CategoricalDtype)
+        assert df_integrated["Q1 - score"].dtype == np.float64
+        assert pd.api.types.is_string_dtype(df_integrated["Q1 - item"])
+
+    def test_fill_categorical_answers_as_their_categories_should(self, tmp_path):
+        # Arrange, items and scores declared as "category" through the column_dtypes of the questionary
+        patients = {patient.id: patient for patient in [mock_a_patient("CUNQ-001", 20), mock_a_patient("CUNQ-002", 30)]}
+        questionaries = {
+            "Q1": mock_a_questionary(tmp_path, "Q1", pd.DataFrame({
+                "id": ["CUNQ-001"],
+                "item": pd.Series(["yes"], dtype="category"),
+                "score": pd.Series([1], dtype="category")})),
+            "Q2": mock_a_questionary(tmp_path, "Q2", pd.DataFrame({
+                "id": ["CUNQ-002"], "item": ["no"], "score": [5.0]})),
+        }
+
+        # Act
+        df_integrated = integrate_questionaries_with_patients(patients, questionaries)
+
+        # Assert
+        assert df_integrated["Q1 - item"].tolist() == ["yes", "No answer"]
+        assert df_integrated["Q1 - score"].tolist() == [1, 0]
+        assert isinstance(df_integrated["Q1 - item"].dtype, pd.CategoricalDtype)
+
+    def test_get_visia_patients_should(self, tmp_path):
+        # Arrange, the birthdates mix formats as the exports of different waves do
+        birth_dates = [years_ago(20).strftime("%d/%m/%Y"), years_ago(35).strftime("%Y-%m-%d"),
+                       years_ago(41).strftime("%d/%m/%Y")]
+        visia_q_patients = mock_the_patients_questionary(tmp_path, ["CUNQ-001", "CUNQ-002", "CUNQ-003"], birth_dates)
+
+        # Act
+        visia_patients = pipeline_get_visia_patients(visia_q_patients)
+
+        # Assert
+        assert list(visia_patients) == ["CUNQ-001", "CUNQ-002", "CUNQ-003"]
+        assert visia_patients["CUNQ-001"] == Patient(
+            id="CUNQ-001", age=20, sex="MUJER", education_level="1-PRIMARIA", clinical_group="G1-clínico-S",
+            city="Vigo", diagnosis="None", treatment="None", saliva_sample=True)
+        assert [visia_patients[id_patient].age for id_patient in visia_patients] == [20, 35, 41]
+        assert visia_patients["CUNQ-002"].sex == "HOMBRE"
+        assert visia_patients["CUNQ-002"].saliva_sample is False
+        assert visia_patients["CUNQ-003"].education_level == "UNK"
+        assert visia_patients["CUNQ-003"].clinical_group == "UNK"
+        df_processed = visia_q_patients.df_post_processed_data
+        assert df_processed["Edad"].tolist() == [20, 35, 41]
+        assert df_processed["Checkbox"].tolist() == [True, False, True]
+        assert (tmp_path / "VSC_processed.csv").exists()
+
+    def test_keep_the_first_position_and_last_answers_of_a_repeated_patient_should(self, tmp_path):
+        # Arrange, CUNQ-001 filled in the questionary twice
+        birth_dates = [years_ago(20).strftime("%d/%m/%Y"), years_ago(35).strftime("%d/%m/%Y"),
+                       years_ago(21).strftime("%d/%m/%Y")]
+        visia_q_patients = mock_the_patients_questionary(tmp_path, ["CUNQ-001", "CUNQ-002", "CUNQ-001"], birth_dates)
+
+        # Act
+        visia_patients = pipeline_get_visia_patients(visia_q_patients)
+
+        # Assert
+        assert list(visia_patients) == ["CUNQ-001", "CUNQ-002"]
+        assert visia_patients["CUNQ-001"].age == 21
+        assert visia_patients["CUNQ-001"].education_level == "UNK"
+        assert visia_patients.to_dataframe()["age"].tolist() == [21, 35]
@@ -1,5 +1,6 @@
 import os
 import shutil
+from unittest import mock
 
 from faker import Faker
 import numpy as np
@@ -7,7 +8,13 @@ import pandas as pd
 import pytest
 
 from visia_science.data import QuestionaryError
-from visia_science.data.questionary import BaseQuestionary
+from visia_science.data.questionary import (
+    BaseQuestionary,
+    SOURCE_FILE_COLUMN,
+    VisiaQuestionary,
+    clear_raw_table_cache,
+)
+from visia_science.files import load_dataframe, load_json_as_dict, save_dataframe
 from test import ROOT_TEST_PATH
 
 
@@ -92,6 +99,195 @@ class TestQuestionaryShould:
         column_check = all([col in testing_q.df_raw_data.columns for col in self.mock_questionary.columns])
         assert column_check
 
+    def test_share_the_raw_table_of_a_file_should(self):
+        # Arrange
+        clear_raw_table_cache()
+        questionaries = [
+            BaseQuestionary(q_file_name_to_search=self.temp_file,
+                            path_to_load_data=ROOT_TEST_PATH,
+                            path_to_save_data=self.temp_folder,
+                            q_name=f"test_questionary_{items}",
+                            column_with_id="id",
+                            column_with_date="date",
+                            columns_with_items=[items],
+                            columns_with_scores=["scores"])
+            for items in ["items", "gender"]
+        ]
+
+        # Act
+        columns_of_the_file = questionaries[0].get_columns_to_keep() + ["gender"]
+        with mock.patch("pandas.read_csv", wraps=pd.read_csv) as read_csv:
+            for questionary in questionaries:
+                questionary.load_raw_data(columns_to_load=columns_of_the_file)
+
+        # Assert
+        assert [call.kwargs.get("nrows") for call in read_csv.call_args_list] == [0, None]
+        assert list(questionaries[0].df_raw_data.columns) == ["id", "date", "items", "scores", SOURCE_FILE_COLUMN]
+        assert list(questionaries[1].df_raw_data.columns) == ["id", "gender", "date", "scores", SOURCE_FILE_COLUMN]
+        assert len(questionaries[1].df_raw_data) == len(self.mock_questionary)
+
+    def test_load_only_the_columns_of_the_questionary_should(self):
+        # Arrange
+        clear_raw_table_cache()
+        testing_q = BaseQuestionary(q_file_name_to_search=self.temp_file,
+                                    path_to_load_data=ROOT_TEST_PATH,
+                                    path_to_save_data=self.temp_folder,
+                                    q_name="test_questionary",
+                                    column_with_id="id",
+                                    column_with_date="date",
+                                    columns_with_items=["items", "not_in_file"],
+                                    columns_with_scores=["scores"],
+                                    column_dtypes={"items": "category", "scores": "float"})
+
+        # Act
+        with mock.patch("pandas.read_csv", wraps=pd.read_csv) as read_csv:
+            testing_q.load_raw_data()
+
+        # Assert
+        assert read_csv.call_args.kwargs["usecols"] == ["id", "date", "items", "scores"]
+        assert isinstance(testing_q.df_raw_data["items"].dtype, pd.CategoricalDtype)
+        assert testing_q.df_raw_data["scores"].dtype == "float64"
+
+    @pytest.mark.parametrize("max_workers", [1, 4])
+    def test_load_all_the_files_of_a_questionary_in_order_should(self, max_workers: int):
+        # Arrange
+        for wave in [2, 1, 3]:
+            self.mock_questionary.assign(scores=wave).to_csv(
+                self.temp_folder / f"waves-{wave}.csv", index=False)
+        testing_q = BaseQuestionary(q_file_name_to_search=self.temp_folder / "waves-",
+                                    path_to_load_data=self.temp_folder,
+                                    path_to_save_data=self.temp_folder,
+                                    q_name="test_questionary",
+                                    column_with_id="id",
+                                    column_with_date="date",
+                                    columns_with_items=["items"],
+                                    columns_with_scores=["scores"])
+
+        # Act
+        testing_q.load_raw_data(max_workers=max_workers)
+
+        # Assert
+        assert len(testing_q.df_raw_data) == 3 * len(self.mock_questionary)
+        assert testing_q.df_raw_data["scores"].unique().tolist() == [1, 2, 3]
+        assert testing_q.df_raw_data[SOURCE_FILE_COLUMN].unique().tolist() == [
+            "waves-1.csv", "waves-2.csv", "waves-3.csv"]
+
+    def test_standardize_spanish_dates_should(self):
+        # Arrange
+        testing_q = VisiaQuestionary(q_file_name_to_search=self.temp_file,
+                                     q_name="test_questionary",
+                                     column_with_id="id",
+                                     column_with_date="date",
+                                     columns_with_items=["items"],
+                                     columns_with_scores=["scores"])
+        df_with_dates = pd.DataFrame({"id": ["CUNQ-001", "CUNQ-002", "CUNQ-003"],
+                                      "date": ["Ene 05, 2024 @ 10:30 am", "Dic 31, 2023 @ 11:59 pm", "not a date"]})
+
+        # Act
+        df_with_dates = testing_q._standardize_date_column_to_datetime(
+            df_with_dates, testing_q.MONTH_MAPPING_SP_ENG, testing_q.DATE_TIME_FORMAT)
+
+        # Assert
+        assert df_with_dates["id"].tolist() == ["CUNQ-001", "CUNQ-002"]
+        assert df_with_dates["date"].tolist() == [pd.Timestamp("2024-01-05 10:30"), pd.Timestamp("2023-12-31 23:59")]
+
+    def test_standardize_ids_without_asking_should(self):
+        # Arrange
+        testing_q = VisiaQuestionary(q_file_name_to_search=self.temp_folder / "ids",
+                                     q_name="test_questionary",
+                                     column_with_id="id",
+                                     column_with_date="date",
+                                     columns_with_items=["items"],
+                                     columns_with_scores=["scores"],
+                                     ID_WITH_WRONG_FORMAT={"cunq-12": "CUNQ-012"})
+        df_with_ids = pd.DataFrame({"id": ["CUNQ-001", "cunq-12", "unknown", "unknown"]})
+
+        # Act
+        with mock.patch("builtins.input", side_effect=AssertionError("The user was asked")):
+            df_with_ids = testing_q._standardize_ids(df_with_ids)
+
+        # Assert
+        assert df_with_ids["id"].tolist() == ["CUNQ-001", "CUNQ-012", "unknown", "unknown"]
+        assert load_json_as_dict(str(self.temp_folder / "test_questionary_ids_unresolved.json")) == {"unknown": 2}
+
+    def test_get_all_the_responses_of_one_patient_should(self):
+        # Arrange
+        testing_q = VisiaQuestionary(q_file_name_to_search=self.temp_file,
+                                     q_name="test_questionary",
+                                     column_with_id="id",
+                                     column_with_date="date",
+                                     columns_with_items=["items"],
+                                     columns_with_scores=["scores"])
+        testing_q.df_post_processed_data = pd.concat([self.mock_questionary, self.mock_questionary.head(5)])
+        id_patient = self.mock_questionary["id"].iloc[0]
+
+        # Act
+        responses_of_patient = testing_q.get_all_the_responses_of_one_patient(id_patient)
+        testing_q.df_post_processed_data = self.mock_questionary
+        responses_after_change = testing_q.get_all_the_responses_of_one_patient(id_patient)
+
+        # Assert
+        assert len(responses_of_patient) == 2
+        assert (responses_of_patient["id"] == id_patient).all()
+        assert len(responses_after_change) == 1
+        assert testing_q.get_all_the_responses_of_one_patient("unknown").empty
+
+    def test_save_dataframe_should(self):
+        # Arrange
+        df_mixed = self.mock_questionary.copy()
+        df_mixed["scores"] = df_mixed["scores"].astype(object)
+        df_mixed.loc[0, "scores"] = "No answer"
+
+        # Act
+        path_to_table = save_dataframe(df_mixed, os.path.join(self.temp_folder, "mixed"))
+        df_loaded = load_dataframe(path_to_table)
+
+        # Assert
+        assert path_to_table.endswith("mixed.csv")
+        assert not os.path.exists(f"{path_to_table}.tmp")
+        assert len(df_loaded) == len(df_mixed)
+        assert list(df_loaded.columns) == list(df_mixed.columns)
+        with pytest.raises(ValueError):
+            save_dataframe(df_mixed, os.path.join(self.temp_folder, "mixed"), output_format="xlsx")
+
+    @pytest.mark.parametrize("output_format", ["parquet", "feather"])
+    def test_save_and_load_dataframe_with_arrow_should(self, output_format: str):
+        # Arrange
+        pytest.importorskip("pyarrow")
+        df_typed = pd.DataFrame({
+            "id": ["CUNQ-001", "CUNQ-002", "CUNQ-003"],
+            "age": np.array([20, 35, 41], dtype=np.int64),
+            "score": [1.5, np.nan, 3.0],
+            "saliva_sample": [True, False, True],
+            "date": pd.to_datetime(["2024-01-05 10:30", "2023-12-31 23:59", "2024-02-29 00:00"]),
+            "sex": pd.Categorical(["MUJER", "HOMBRE", "MUJER"]),
+        })
+
+        # Act
+        path_to_table = save_dataframe(
+            df_typed, os.path.join(self.temp_folder, "typed"), output_format=output_format)
+        df_loaded = load_dataframe(path_to_table)
+        df_loaded_columns = load_dataframe(path_to_table, columns=["id", "date"])
+
+        # Assert
+        assert path_to_table.endswith(f"typed.{output_format}")
+        pd.testing.assert_frame_equal(df_loaded, df_typed)
+        pd.testing.assert_frame_equal(df_loaded_columns, df_typed[["id", "date"]])
+
+    def test_save_feather_uncompressed_should(self):
+        # Arrange
+        feather = pytest.importorskip("pyarrow.feather")
+        df_numbers = pd.DataFrame({"number": np.arange(1000, dtype=np.int64)})
+
+        # Act
+        path_to_table = save_dataframe(
+            df_numbers, os.path.join(self.temp_folder, "numbers"), output_format="feather")
+        table = feather.read_table(path_to_table, memory_map=True)
+
+        # Assert
+        assert os.path.getsize(path_to_table) > df_numbers.memory_usage(index=False).sum()
+        assert table.column("number").to_pylist() == list(range(1000))
+
 
 if __name__ == "__main__":
     # Run all tests in the module
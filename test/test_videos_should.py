@@ -0,0 +1,182 @@
+import json
+import os
+import time
+from pathlib import Path
+from unittest import mock
+
+import pandas as pd
+import pytest
+
+from visia_science.data.multimedia import Multimedia
+from visia_science.pipelines import videos
+from visia_science.pipelines.videos import (
+    build_metadata_dataframe,
+    pipeline_videos,
+    process_video_file,
+)
+
+
+def fake_process_video_file(video_file_path: str, *args) -> dict:
+    """Stand-in for process_video_file, it must be defined at module level to be sent to the process pool."""
+    file_name = Path(video_file_path).stem
+    if file_name.startswith("crash"):
+        # A worker killed without raising, as the OOM killer or a segfault in a native decoder would do
+        os._exit(1)
+    if file_name.startswith("fail"):
+        raise RuntimeError(f"Error decoding {file_name}")
+    if file_name.startswith("interrupt"):
+        raise KeyboardInterrupt
+    if file_name.startswith("slow"):
+        # Still in flight when a faster file crashes its worker
+        time.sleep(0.5)
+    return {"file_id": file_name, "id": file_name.split("_")[0]}
+
+
+def create_video_files(path_to_raw_video: Path, file_names: list) -> None:
+    path_to_raw_video.mkdir(parents=True, exist_ok=True)
+    for file_name in file_names:
+        (path_to_raw_video / file_name).write_bytes(b"not a real video")
+
+
+class TestVideosPipelineShould:
+    @pytest.mark.parametrize("workers, max_tasks_in_flight", [(1, None), (2, 1), (2, None)])
+    def test_process_videos_in_order_and_record_failures_should(
+        self, tmp_path, workers: int, max_tasks_in_flight: int
+    ):
+        # Arrange
+        path_to_raw_video, path_to_save = tmp_path / "raw", tmp_path / "processed"
+        file_names = ["slow_7.mp4", "d_4.mp4", "crash_3.mp4", "a_1.mp4", "fail_2.mp4", "c_5.mp4", "b_6.mp4"]
+        if workers == 1:
+            # A crash would kill the test process itself
+            file_names.remove("crash_3.mp4")
+        create_video_files(path_to_raw_video, file_names)
+
+        # Act
+        with mock.patch.object(videos, "process_video_file", fake_process_video_file):
+            # The files in flight with the crash are retried, only the file that caused it fails
+            df_metadata = pipeline_videos(
+                str(path_to_raw_video),
+                str(path_to_save),
+                workers=workers,
+                max_tasks_in_flight=max_tasks_in_flight,
+                checkpoint_every=2,
+            )
+
+        # Assert
+        assert df_metadata["file_id"].tolist() == ["a_1", "b_6", "c_5", "d_4", "slow_7"]
+        assert not (path_to_save / "metadata_all_videos.checkpoint.jsonl").exists()
+
+    def test_flush_the_checkpoint_when_interrupted_should(self, tmp_path):
+        # Arrange
+        path_to_raw_video, path_to_save = tmp_path / "raw", tmp_path / "processed"
+        create_video_files(path_to_raw_video, ["a_1.mp4", "interrupt_2.mp4"])
+
+        # Act
+        with mock.patch.object(videos, "process_video_file", fake_process_video_file):
+            with pytest.raises(KeyboardInterrupt):
+                pipeline_videos(
+                    str(path_to_raw_video), str(path_to_save), use_index=False, checkpoint_every=50
+                )
+
+        # Assert
+        with open(path_to_save / "metadata_all_videos.checkpoint.jsonl") as file:
+            checkpoint_lines = [json.loads(line) for line in file]
+        assert [line["metadata"]["file_id"] for line in checkpoint_lines] == ["a_1"]
+
+    def test_process_a_video_with_the_default_whisper_model_should(self, tmp_path):
+        # Arrange
+        create_video_files(tmp_path, ["a_1.mp4"])
+
+        # Act, None is what main.py passes when WHISPER_MODEL is not set
+        multimedia_metadata = process_video_file(
+            str(tmp_path / "a_1.mp4"),
+            str(tmp_path),
+            whisper_model_name=None,
+            path_to_transcription_cache=None,
+        )
+
+        # Assert, the file is not a real video, so it has no metadata
+        assert multimedia_metadata is None
+
+    @pytest.mark.parametrize("transcribe", [False, True])
+    def test_transcribe_videos_only_when_asked_should(self, tmp_path, transcribe: bool):
+        # Arrange
+        path_to_raw_video, path_to_save = tmp_path / "raw", tmp_path / "processed"
+        create_video_files(path_to_raw_video, ["a_1.mp4"])
+
+        def fake_get_metadata(multimedia: Multimedia) -> dict:
+            multimedia.multimedia_metadata = {"file_id": multimedia.path_to_raw_data.stem}
+            return multimedia.multimedia_metadata
+
+        def fake_transcribe(multimedia: Multimedia, language: str = "es"):
+            multimedia.multimedia_metadata["transcription"] = "hola"
+            multimedia.multimedia_metadata["transcription_model"] = "large"
+            return mock.MagicMock()
+
+        # Act
+        with mock.patch.object(Multimedia, "get_metadata", fake_get_metadata), \
+                mock.patch.object(Multimedia, "transcribe", fake_transcribe):
+            df_metadata = pipeline_videos(
+                str(path_to_raw_video), str(path_to_save), use_index=False, transcribe=transcribe
+            )
+
+        # Assert
+        assert ("transcription" in df_metadata.columns) == transcribe
+
+    def test_transcribe_videos_indexed_without_transcription_should(self, tmp_path):
+        # Arrange
+        path_to_raw_video, path_to_save = tmp_path / "raw", tmp_path / "processed"
+        create_video_files(path_to_raw_video, ["a_1.mp4"])
+        transcribed_models = []
+
+        def fake_get_metadata(multimedia: Multimedia) -> dict:
+            multimedia.multimedia_metadata = {"file_id": multimedia.path_to_raw_data.stem}
+            return multimedia.multimedia_metadata
+
+        def fake_transcribe(multimedia: Multimedia, language: str = "es"):
+            transcribed_models.append(multimedia.whisper_model_name)
+            multimedia.multimedia_metadata["transcription"] = "hola"
+            multimedia.multimedia_metadata["transcription_model"] = multimedia.whisper_model_name
+            return mock.MagicMock()
+
+        # Act
+        with mock.patch.object(Multimedia, "get_metadata", fake_get_metadata), \
+                mock.patch.object(Multimedia, "transcribe", fake_transcribe):
+            pipeline_videos(str(path_to_raw_video), str(path_to_save))
+            df_metadata = pipeline_videos(
+                str(path_to_raw_video), str(path_to_save), transcribe=True, whisper_model_name="base"
+            )
+            pipeline_videos(
+                str(path_to_raw_video), str(path_to_save), transcribe=True, whisper_model_name="base"
+            )
+            pipeline_videos(
+                str(path_to_raw_video), str(path_to_save), transcribe=True, whisper_model_name="small"
+            )
+
+        # Assert, the index is only reused when it has a transcription of the same model
+        assert df_metadata["transcription"].tolist() == ["hola"]
+        assert transcribed_models == ["base", "small"]
+
+    def test_build_metadata_dataframe_should(self):
+        # Arrange
+        metadata_records = [
+            {"file_id": "a_1", "audio-duration": 1.5, "ffmpeg_confidence": 100},
+            {},
+            {"file_id": "b_2", "video-width": 640, "audio-duration": 2.0, "ffmpeg_confidence": 50},
+        ]
+
+        # Act
+        df_metadata = build_metadata_dataframe(metadata_records)
+        # The previous pipeline concatenated a one-row DataFrame per video
+        df_metadata_row_by_row = pd.DataFrame()
+        for metadata_record in metadata_records:
+            df_metadata_row_by_row = pd.concat(
+                [df_metadata_row_by_row, pd.DataFrame(metadata_record, index=[0])]
+            )
+
+        # Assert
+        assert df_metadata.columns.tolist() == [
+            "file_id", "audio-duration", "ffmpeg_confidence", "video-width"]
+        assert df_metadata.iloc[1].isna().all()
+        pd.testing.assert_frame_equal(df_metadata, df_metadata_row_by_row.reset_index(drop=True))
+        assert build_metadata_dataframe([]).empty
@@ -1,5 +1,11 @@
+import asyncio
+import json
+import math
+import os
+import threading
+from contextlib import closing
 from pathlib import Path
-from typing import Tuple
+from typing import Iterator, List, Optional, Tuple
 
 import ffmpeg
 import librosa
@@ -7,10 +13,160 @@ import numpy as np
 import pandas as pd
 import torch
 import whisper
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from visia_science import app_logger
-from visia_science.responses.http import DataResponse, BasicResponse, DataFrameResponse
+from visia_science.data.multimedia_index import (
+    TranscriptionCache,
+    calculate_audio_content_hash,
+)
+from visia_science.responses.http import (
+    BasicResponse,
+    DataFrameResponse,
+    DataResponse,
+    ListResponse,
+)
+
+# Shared ffprobe results keyed by (resolved path, size, mtime) so a file is probed once per process
+_PROBE_CACHE: dict = {}
+
+
+def _probe_cache_key(file_path) -> tuple:
+    file_stat = os.stat(file_path)
+    return str(Path(file_path).resolve()), file_stat.st_size, file_stat.st_mtime_ns
+
+
+def _new_probe_error(probe_error: ffmpeg.Error) -> ffmpeg.Error:
+    # Raising the cached error itself would add the frames of every raise to its traceback and keep them in the cache
+    return ffmpeg.Error("ffprobe", probe_error.stdout, probe_error.stderr)
+
+
+def probe_media(file_path) -> dict:
+    """
+    Runs ffmpeg.probe over a file and caches the result by (path, size, mtime). Every Multimedia and
+    MediaObject instance shares the cache, so a file costs a single ffprobe subprocess per run unless
+    it changes on disk. Probe errors are cached as well.
+
+    :param file_path: The path to the multimedia file
+    :return: The ffprobe output as a dict
+    :raises ffmpeg.Error: If ffprobe fails to read the file
+    """
+    try:
+        cache_key = _probe_cache_key(file_path)
+    except OSError:
+        # Let ffprobe report missing or unreadable files as usual
+        return ffmpeg.probe(str(file_path))
+
+    probe = _PROBE_CACHE.get(cache_key)
+    if probe is None:
+        try:
+            probe = ffmpeg.probe(str(file_path))
+        except ffmpeg.Error as e:
+            probe = _new_probe_error(e)
+        _PROBE_CACHE[cache_key] = probe
+
+    if isinstance(probe, ffmpeg.Error):
+        raise _new_probe_error(probe)
+    return probe
+
+
+async def probe_media_async(file_path, semaphore: asyncio.Semaphore = None) -> dict:
+    """
+    Asyncio version of probe_media. It runs ffprobe as an asyncio subprocess, so many files can be probed at the same
+    time, and shares the cache with probe_media.
+
+    :param file_path: The path to the multimedia file
+    :param semaphore: An optional semaphore that limits the number of ffprobe processes running at once
+    :return: The ffprobe output as a dict
+    :raises ffmpeg.Error: If ffprobe fails to read the file
+    """
+    try:
+        cache_key = _probe_cache_key(file_path)
+    except OSError:
+        cache_key = None
+
+    probe = _PROBE_CACHE.get(cache_key)
+    if probe is None:
+        # Same command as ffmpeg.probe
+        command = ["ffprobe", "-show_format", "-show_streams", "-of", "json", str(file_path)]
+        if semaphore is None:
+            semaphore = asyncio.Semaphore(1)
+        async with semaphore:
+            process = await asyncio.create_subprocess_exec(
+                *command, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE
+            )
+            out, err = await process.communicate()
+
+        if process.returncode != 0:
+            probe = ffmpeg.Error("ffprobe", out, err)
+        else:
+            probe = json.loads(out.decode("utf-8"))
+
+        if cache_key is not None:
+            _PROBE_CACHE[cache_key] = probe
+
+    if isinstance(probe, ffmpeg.Error):
+        raise _new_probe_error(probe)
+    return probe
+
+
+async def probe_media_batch_async(file_paths: list, max_concurrent_probes: int = 32) -> list:
+    """
+    Probe many files concurrently with at most max_concurrent_probes ffprobe processes running at once.
+
+    :param file_paths: The paths to the multimedia files
+    :param max_concurrent_probes: The maximum number of ffprobe processes running at once
+    :return: The ffprobe output of each file, or the exception raised while probing it
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_probes)
+    return await asyncio.gather(
+        *[probe_media_async(file_path, semaphore) for file_path in file_paths],
+        return_exceptions=True,
+    )
+
+
+def clear_probe_cache() -> None:
+    _PROBE_CACHE.clear()
+
+
+# Absolute sample value from which a float audio sample is considered clipped
+CLIPPING_LEVEL: float = 0.999
+
+# Whisper models loaded in this process keyed by (model name, device)
+_WHISPER_MODELS: dict = {}
+
+
+def load_whisper_model(model_name: str, device: str = None) -> whisper.Whisper:
+    """
+    Loads a whisper model once per process and device. Later calls return the same instance, so it is shared by every
+    Multimedia object of the process, and each worker of a process pool loads it only once.
+
+    :param model_name: The name of the whisper model, e.g. "base.en" or "large"
+    :param device: The device where the model is loaded. None uses cuda if it is available
+    :return: The whisper model
+    """
+    if device is None:
+        device = "cuda" if torch.cuda.is_available() else "cpu"
+
+    model_key = (model_name, device)
+    if model_key not in _WHISPER_MODELS:
+        app_logger.info(f"Multimedia - Loading whisper model {model_name} on {device}")
+        _WHISPER_MODELS[model_key] = whisper.load_model(model_name, device=device)
+    return _WHISPER_MODELS[model_key]
+
+
+def get_whisper_model_name(model_name: Optional[str], language: str) -> str:
+    """
+    Returns the whisper model used to transcribe a language: model_name if it is set, otherwise base.en for English and
+    large for any other language.
+
+    :param model_name: The name of the whisper model, or None to use the default model of the language
+    :param language: The language of the audio
+    :return: The name of the whisper model
+    """
+    if model_name is not None:
+        return model_name
+    return "base.en" if language == "en" else "large"
 
 
 def preprocess_audio_ffmpeg_stream(stream_with_audio_metadata: dict) -> dict:
@@ -58,6 +214,310 @@ def preprocess_video_ffmpeg_stream(stream_with_video_metadata: dict) -> dict:
     return processed_video_stream
 
 
+def calculate_frame_rms_and_zcr(
+    audio_data: np.ndarray, frame_length: int, hop_length: int, zero_threshold: float = 1e-10
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Calculate the RMS energy and the zero-crossing rate of every frame of an audio in a single vectorized pass. The
+    frames match librosa.feature.rms and librosa.feature.zero_crossing_rate with center=True, but the sum over each
+    frame is taken from prefix sums of the signal, so the cost is linear in the number of samples whatever the overlap.
+
+    :param audio_data: The audio as a 1D ndarray
+    :param frame_length: The number of samples per frame
+    :param hop_length: The number of samples between the start of two frames
+    :param zero_threshold: Samples with an absolute value below this threshold count as zero
+    :return: The RMS and the ZCR of each frame
+    """
+    padding = frame_length // 2
+    number_of_frames = 1 + (len(audio_data) + 2 * padding - frame_length) // hop_length
+    frame_starts = np.arange(number_of_frames) * hop_length
+
+    # RMS: sum of squares of each frame, the signal is zero-padded as librosa.feature.rms does
+    squared_audio = np.pad(np.square(audio_data, dtype=np.float64), padding)
+    cumulative_energy = np.concatenate(([0.0], np.cumsum(squared_audio)))
+    frame_energy = cumulative_energy[frame_starts + frame_length] - cumulative_energy[frame_starts]
+    rms = np.sqrt(np.maximum(frame_energy, 0.0) / frame_length)
+
+    # ZCR: sign changes inside each frame, the signal is edge-padded as librosa.feature.zero_crossing_rate does
+    negative_samples = np.pad(audio_data < -zero_threshold, padding, mode="edge")
+    crossings = np.concatenate(([False], negative_samples[1:] != negative_samples[:-1]))
+    cumulative_crossings = np.cumsum(crossings)
+    frame_crossings = (
+        cumulative_crossings[frame_starts + frame_length - 1] - cumulative_crossings[frame_starts]
+    )
+    zcr = frame_crossings / frame_length
+
+    return rms, zcr
+
+
+def summarize_audio_quality(
+    rms: np.ndarray,
+    zcr: np.ndarray,
+    snr_threshold: float,
+    peak: float,
+    clipped_samples: int,
+    number_of_samples: int,
+    silence_threshold_db: float = -60.0,
+) -> dict:
+    """
+    Summarize the frame descriptors of an audio into the audio quality fields of the multimedia metadata. The SNR
+    compares the mean RMS of the frames above the snr_threshold percentile (signal) with the rest of frames (noise).
+
+    :param rms: The RMS of each frame
+    :param zcr: The zero-crossing rate of each frame
+    :param snr_threshold: The percentile of the RMS that splits signal and noise frames
+    :param peak: The maximum absolute value of the audio
+    :param clipped_samples: The number of samples at full scale
+    :param number_of_samples: The number of samples of the audio
+    :param silence_threshold_db: The RMS in dBFS below which a frame is silent
+    :return: A dict with the audio quality fields
+    """
+    threshold = np.percentile(rms, snr_threshold)
+    signal_energy = np.mean(rms[rms > threshold])
+    noise_energy = np.mean(rms[rms <= threshold])
+
+    return _audio_quality_fields(
+        snr=10 * np.log10(signal_energy / noise_energy),
+        zcr_max=np.max(zcr),
+        zcr_min=np.min(zcr),
+        zcr_avg=np.mean(zcr),
+        rms_avg=np.mean(rms),
+        peak=peak,
+        clipping_ratio=clipped_samples / max(number_of_samples, 1),
+        silence_ratio=np.mean(rms < 10 ** (silence_threshold_db / 20)),
+    )
+
+
+def _audio_quality_fields(
+    snr, zcr_max, zcr_min, zcr_avg, rms_avg, peak, clipping_ratio, silence_ratio
+) -> dict:
+    return {
+        "audio-SNR(dB)": snr,
+        "audio-ZCR_max ": zcr_max,
+        "audio-ZCR_min": zcr_min,
+        "audio-ZCR_avg": zcr_avg,
+        "audio-RMS_avg": rms_avg,
+        "audio-peak": peak,
+        "audio-clipping_ratio": clipping_ratio,
+        "audio-silence_ratio": silence_ratio,
+    }
+
+
+class StreamingAudioQuality:
+    """
+    Audio quality descriptors of an audio fed block by block, with a memory footprint that doesn't depend on its
+    duration. The frames and the fields are the same as in calculate_frame_rms_and_zcr and summarize_audio_quality.
+    Every field is exact except the SNR: the percentile that splits signal and noise frames is taken from a histogram
+    of the frame RMS in dB with bins of rms_resolution_db.
+
+    Example Usage
+    -------------
+        audio_quality = StreamingAudioQuality(frame_length=400, hop_length=160, snr_threshold=95)
+        for audio_block in audio_object.iter_audio_blocks():
+            audio_quality.update(audio_block)
+        dict_audio_quality = audio_quality.finish()
+    """
+
+    MIN_RMS_DB: float = -200.0
+    MAX_RMS_DB: float = 20.0
+
+    def __init__(
+        self,
+        frame_length: int,
+        hop_length: int,
+        snr_threshold: float,
+        silence_threshold_db: float = -60.0,
+        zero_threshold: float = 1e-10,
+        rms_resolution_db: float = 0.05,
+    ):
+        self.frame_length = frame_length
+        self.hop_length = hop_length
+        self.snr_threshold = snr_threshold
+        self.silence_threshold = 10 ** (silence_threshold_db / 20)
+        self.zero_threshold = zero_threshold
+        self.rms_resolution_db = rms_resolution_db
+
+        # Samples not consumed by a frame yet, in padded coordinates
+        self._padding = frame_length // 2
+        self._pending_squares = None
+        self._pending_negatives = None
+
+        # Running statistics
+        number_of_bins = int(np.ceil((self.MAX_RMS_DB - self.MIN_RMS_DB) / rms_resolution_db))
+        self._rms_histogram_counts = np.zeros(number_of_bins, dtype=np.int64)
+        self._rms_histogram_sums = np.zeros(number_of_bins, dtype=np.float64)
+        self._number_of_frames = 0
+        self._number_of_silent_frames = 0
+        self._zcr_max, self._zcr_min, self._zcr_sum = -np.inf, np.inf, 0.0
+        self._peak = 0.0
+        self._clipped_samples = 0
+        self._number_of_samples = 0
+
+    def update(self, audio_block: np.ndarray) -> None:
+        if len(audio_block) == 0:
+            return
+
+        self._peak = max(self._peak, float(np.max(np.abs(audio_block))))
+        self._clipped_samples += int(np.count_nonzero(np.abs(audio_block) >= CLIPPING_LEVEL))
+        self._number_of_samples += len(audio_block)
+
+        squares = np.square(audio_block, dtype=np.float64)
+        negatives = audio_block < -self.zero_threshold
+        if self._pending_squares is None:
+            # Left padding: zeros for the RMS and the first sample for the ZCR, as librosa does
+            self._pending_squares = np.zeros(self._padding)
+            self._pending_negatives = np.full(self._padding, negatives[0])
+
+        self._pending_squares = np.concatenate((self._pending_squares, squares))
+        self._pending_negatives = np.concatenate((self._pending_negatives, negatives))
+        self._consume_complete_frames()
+
+    def _consume_complete_frames(self) -> None:
+        number_of_frames = 0
+        if len(self._pending_squares) >= self.frame_length:
+            number_of_frames = (
+                1 + (len(self._pending_squares) - self.frame_length) // self.hop_length
+            )
+        if number_of_frames == 0:
+            return
+
+        frame_starts = np.arange(number_of_frames) * self.hop_length
+        cumulative_energy = np.concatenate(([0.0], np.cumsum(self._pending_squares)))
+        frame_energy = (
+            cumulative_energy[frame_starts + self.frame_length] - cumulative_energy[frame_starts]
+        )
+        rms = np.sqrt(np.maximum(frame_energy, 0.0) / self.frame_length)
+
+        negatives = self._pending_negatives
+        crossings = np.concatenate(([False], negatives[1:] != negatives[:-1]))
+        cumulative_crossings = np.cumsum(crossings)
+        zcr = (
+            cumulative_crossings[frame_starts + self.frame_length - 1]
+            - cumulative_crossings[frame_starts]
+        ) / self.frame_length
+
+        self._add_frames(rms, zcr)
+
+        # Keep the samples of the frames that are not complete yet
+        first_pending_sample = number_of_frames * self.hop_length
+        self._pending_squares = self._pending_squares[first_pending_sample:]
+        self._pending_negatives = self._pending_negatives[first_pending_sample:]
+
+    def _add_frames(self, rms: np.ndarray, zcr: np.ndarray) -> None:
+        with np.errstate(divide="ignore"):
+            rms_db = 20 * np.log10(rms)
+        rms_bins = np.clip(
+            ((rms_db - self.MIN_RMS_DB) / self.rms_resolution_db).astype(np.int64),
+            0,
+            len(self._rms_histogram_counts) - 1,
+        )
+        np.add.at(self._rms_histogram_counts, rms_bins, 1)
+        np.add.at(self._rms_histogram_sums, rms_bins, rms)
+
+        self._number_of_frames += len(rms)
+        self._number_of_silent_frames += int(np.count_nonzero(rms < self.silence_threshold))
+        self._zcr_max = max(self._zcr_max, float(np.max(zcr)))
+        self._zcr_min = min(self._zcr_min, float(np.min(zcr)))
+        self._zcr_sum += float(np.sum(zcr))
+
+    def finish(self) -> dict:
+        """
+        Consume the last frames of the audio and return the audio quality fields.
+
+        :return: A dict with the same fields as summarize_audio_quality
+        """
+        if self._pending_squares is None:
+            raise RuntimeError("No audio was provided to calculate the audio quality")
+
+        # Right padding: zeros for the RMS and the last sample for the ZCR, as librosa does
+        self._pending_squares = np.concatenate((self._pending_squares, np.zeros(self._padding)))
+        self._pending_negatives = np.concatenate(
+            (self._pending_negatives, np.full(self._padding, self._pending_negatives[-1]))
+        )
+        self._consume_complete_frames()
+
+        # Frames up to the percentile rank are noise and the rest are signal. The frames of the bin holding the
+        # percentile are split between both by rank, with the mean RMS of the bin
+        threshold_rank = self.snr_threshold / 100 * (self._number_of_frames - 1)
+        cumulative_counts = np.cumsum(self._rms_histogram_counts)
+        threshold_bin = int(np.searchsorted(cumulative_counts, threshold_rank, side="right"))
+
+        frames_before_bin = (
+            cumulative_counts[threshold_bin] - self._rms_histogram_counts[threshold_bin]
+        )
+        noise_frames_in_bin = int(np.floor(threshold_rank)) + 1 - frames_before_bin
+        signal_frames_in_bin = self._rms_histogram_counts[threshold_bin] - noise_frames_in_bin
+        bin_mean_rms = (
+            self._rms_histogram_sums[threshold_bin] / self._rms_histogram_counts[threshold_bin]
+        )
+
+        signal_energy = (
+            self._rms_histogram_sums[threshold_bin + 1 :].sum()
+            + signal_frames_in_bin * bin_mean_rms
+        ) / (self._rms_histogram_counts[threshold_bin + 1 :].sum() + signal_frames_in_bin)
+        noise_energy = (
+            self._rms_histogram_sums[:threshold_bin].sum() + noise_frames_in_bin * bin_mean_rms
+        ) / (frames_before_bin + noise_frames_in_bin)
+
+        return _audio_quality_fields(
+            snr=10 * np.log10(signal_energy / noise_energy),
+            zcr_max=self._zcr_max,
+            zcr_min=self._zcr_min,
+            zcr_avg=self._zcr_sum / self._number_of_frames,
+            rms_avg=self._rms_histogram_sums.sum() / self._number_of_frames,
+            peak=self._peak,
+            clipping_ratio=self._clipped_samples / max(self._number_of_samples, 1),
+            silence_ratio=self._number_of_silent_frames / self._number_of_frames,
+        )
+
+
+def _iter_ffmpeg_stdout(process, buffer_view: memoryview, error_message: str) -> Iterator[int]:
+    """
+    Fill buffer_view with the stdout of an ffmpeg process again and again, and yield the number of bytes read each
+    time, until stdout reaches EOF. The stderr of the process is drained by a background thread: if it was only read at
+    the end, a file that logs more than a pipe buffer of errors would block ffmpeg, and the read of stdout with it.
+
+    :param process: The ffmpeg process, started with pipe_stdout=True and pipe_stderr=True
+    :param buffer_view: A writable byte view over the buffer to fill
+    :param error_message: The start of the message of the error raised if ffmpeg fails
+    :return: An iterator over the number of bytes read into the buffer
+    :raises RuntimeError: If ffmpeg exits with an error once stdout reaches EOF
+    """
+    stderr_chunks = []
+    stderr_thread = threading.Thread(
+        target=lambda: stderr_chunks.append(process.stderr.read()), daemon=True
+    )
+    stderr_thread.start()
+
+    is_stdout_read = False
+    try:
+        while True:
+            # Fill the buffer, the pipe may return less bytes than requested
+            bytes_read = 0
+            while bytes_read < len(buffer_view):
+                chunk_size = process.stdout.readinto(buffer_view[bytes_read:])
+                if not chunk_size:
+                    break
+                bytes_read += chunk_size
+
+            if bytes_read > 0:
+                yield bytes_read
+
+            if bytes_read < len(buffer_view):
+                is_stdout_read = True
+                break
+    finally:
+        # Closing stdout stops ffmpeg if the iteration is left before EOF
+        process.stdout.close()
+        return_code = process.wait()
+        stderr_thread.join()
+        process.stderr.close()
+
+    if is_stdout_read and return_code != 0:
+        stderr_output = b"".join(stderr_chunks).decode(errors="replace")
+        raise RuntimeError(f"{error_message}: {stderr_output}")
+
+
 class MediaObject:
     def __init__(self, file_path, metadata=None):
         self.file_path = file_path
@@ -69,18 +529,23 @@ class MediaObject:
 
     def get_metadata(self):
         try:
-            probe = ffmpeg.probe(self.file_path)
+            probe = probe_media(self.file_path)
             return probe
         except ffmpeg.Error as e:
             raise RuntimeError(f"Error probing file: {e.stderr.decode()}")
 
 
 class AudioObject(MediaObject):
-    def __init__(self, file_path):
+    def __init__(self, file_path, sample_rate: int = None, load_audio_data: bool = True):
         super().__init__(file_path)
 
         self.audio_stream = self.get_audio_stream()
-        self.audio_data, self.sample_rate = self.get_audio_data()
+        if load_audio_data:
+            self.audio_data, self.sample_rate = self.get_audio_data(sample_rate)
+        else:
+            # Long recordings don't fit in memory, use iter_audio_blocks to process them in blocks
+            self.audio_data = None
+            self.sample_rate = sample_rate or self.audio_stream["audio-sample_rate"]
 
     def get_audio_stream(self) -> dict:
         audio_stream = {}
@@ -91,19 +556,65 @@ class AudioObject(MediaObject):
         audio_stream = preprocess_audio_ffmpeg_stream(audio_stream)
         return audio_stream
 
-    def get_audio_data(self) -> Tuple[np.ndarray, int]:
+    def get_audio_data(self, sample_rate: int = None) -> Tuple[np.ndarray, int]:
+        """
+        Decode only the audio stream of the file with ffmpeg as mono float32 PCM, read straight from the ffmpeg pipe.
+
+        :param sample_rate: The sample rate of the decoded audio. None keeps the sample rate of the file
+        :return: The audio as a float32 ndarray and its sample rate
+        """
+        if sample_rate is None:
+            sample_rate = self.audio_stream["audio-sample_rate"]
+
         try:
-            audio_array, sample_rate = librosa.load(self.file_path, sr=None)
+            out, _ = (
+                ffmpeg.input(self.file_path)
+                .output(
+                    "pipe:", map="0:a:0", format="f32le", acodec="pcm_f32le", ac=1, ar=sample_rate
+                )
+                .run(capture_stdout=True, capture_stderr=True)
+            )
+            audio_array = np.frombuffer(out, np.float32)
             return audio_array, sample_rate
-        except Exception as e:
-            raise RuntimeError(f"Error converting audio to ndarray: {e}")
+        except ffmpeg.Error as e:
+            raise RuntimeError(f"Error converting audio to ndarray: {e.stderr.decode()}")
+
+    def iter_audio_blocks(self, block_size: int = 1024 * 1024) -> Iterator[np.ndarray]:
+        """
+        Decode only the audio stream of the file with ffmpeg as mono float32 PCM at self.sample_rate and yield it in
+        blocks of at most block_size samples. Every block is a view over the same preallocated buffer that is
+        overwritten by the next block, copy it if it has to outlive the iteration.
+
+        :param block_size: The number of samples per block
+        :return: An iterator over 1D float32 arrays
+        """
+        sample_buffer = np.empty(block_size, dtype=np.float32)
+        buffer_view = memoryview(sample_buffer).cast("B")
+        sample_size = sample_buffer.itemsize
+
+        process = (
+            ffmpeg.input(self.file_path)
+            .output(
+                "pipe:", map="0:a:0", format="f32le", acodec="pcm_f32le", ac=1, ar=self.sample_rate
+            )
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+        with closing(
+            _iter_ffmpeg_stdout(process, buffer_view, "Error converting audio to ndarray")
+        ) as bytes_read_per_block:
+            for bytes_read in bytes_read_per_block:
+                samples_read = bytes_read // sample_size
+                if samples_read > 0:
+                    yield sample_buffer[:samples_read]
 
 
 class VideoObject(MediaObject):
-    def __init__(self, file_path):
+    def __init__(self, file_path, load_video_data: bool = True):
         super().__init__(file_path)
         self.video_stream = self.get_video_stream()
-        self.video_data = self.get_video_data()
+        # Long videos don't fit in memory, use iter_video_frames to process them in batches
+        self.video_data = self.get_video_data() if load_video_data else None
 
     def get_video_stream(self) -> dict:
         video_stream = {}
@@ -127,6 +638,36 @@ class VideoObject(MediaObject):
         except ffmpeg.Error as e:
             raise RuntimeError(f"Error converting video to ndarray: {e}")
 
+    def iter_video_frames(self, batch_size: int = 32) -> Iterator[np.ndarray]:
+        """
+        Decode the video with ffmpeg and yield its rgb24 frames in batches of at most batch_size frames, so the memory
+        used doesn't depend on the duration of the video. Every batch is a view over the same preallocated buffer that
+        is overwritten by the next batch, copy it if it has to outlive the iteration.
+
+        :param batch_size: The number of frames decoded per batch
+        :return: An iterator over arrays with shape (frames, height, width, 3)
+        """
+        width = int(self.video_stream["width"])
+        height = int(self.video_stream["height"])
+        frame_size = height * width * 3
+
+        frame_buffer = np.empty((batch_size, height, width, 3), dtype=np.uint8)
+        buffer_view = memoryview(frame_buffer).cast("B")
+
+        process = (
+            ffmpeg.input(self.file_path)
+            .output("pipe:", format="rawvideo", pix_fmt="rgb24")
+            .global_args("-loglevel", "error")
+            .run_async(pipe_stdout=True, pipe_stderr=True)
+        )
+        with closing(
+            _iter_ffmpeg_stdout(process, buffer_view, "Error converting video to ndarray")
+        ) as bytes_read_per_batch:
+            for bytes_read in bytes_read_per_batch:
+                frames_read = bytes_read // frame_size
+                if frames_read > 0:
+                    yield frame_buffer[:frames_read]
+
 
 class Multimedia(BaseModel):
     path_to_raw_data: Path
@@ -134,22 +675,99 @@ class Multimedia(BaseModel):
 
     multimedia_metadata: dict = None
 
-    audio_data: np.ndarray = None
+    # Sample rate of audio_data. None keeps the sample rate of the file, whisper expects 16000
+    audio_sample_rate: Optional[int] = None
     threshold_snr: int = 95
     hop_size_s: float = 0.010
     window_size_s: float = 0.025
 
-    video_data: np.ndarray = None
-
     transcription: str = None
+    # None uses base.en for English and large for any other language
+    whisper_model_name: Optional[str] = None
+    # SQLite file where whisper results are cached. None disables the cache
+    path_to_transcription_cache: Optional[Path] = None
+
+    # Decoded payloads, see the audio_data and video_data properties
+    _audio_data: np.ndarray = PrivateAttr(default=None)
+    _audio_data_sample_rate: int = PrivateAttr(default=None)
+    _video_data: np.ndarray = PrivateAttr(default=None)
 
     class Config:
         arbitrary_types_allowed = True
 
+    @property
+    def audio_data(self) -> Optional[np.ndarray]:
+        """The audio of the file, decoded on first access and kept until release_multimedia is called."""
+        if self._audio_data is None and self._is_multimedia_loaded() and self.is_multimedia():
+            audio_object = AudioObject(self.path_to_raw_data, sample_rate=self.audio_sample_rate)
+            self._audio_data = audio_object.audio_data
+            self._audio_data_sample_rate = audio_object.sample_rate
+        return self._audio_data
+
+    @audio_data.setter
+    def audio_data(self, audio_data: Optional[np.ndarray]):
+        self._audio_data = audio_data
+        self._audio_data_sample_rate = None
+
+    def _get_audio_data_sample_rate(self) -> int:
+        if self._audio_data_sample_rate is None:
+            return self.multimedia_metadata["audio-sample_rate"]
+        return self._audio_data_sample_rate
+
+    @property
+    def video_data(self) -> Optional[np.ndarray]:
+        """The frames of the file, decoded on first access and kept until release_multimedia is called."""
+        if self._video_data is None and self._is_multimedia_loaded() and self.is_video():
+            video_object = VideoObject(self.path_to_raw_data)
+            self._video_data = video_object.video_data
+        return self._video_data
+
+    @video_data.setter
+    def video_data(self, video_data: Optional[np.ndarray]):
+        self._video_data = video_data
+
+    def get_audio_data_at_sample_rate(self, sample_rate: int) -> np.ndarray:
+        """
+        Return audio_data at the given sample rate. If the audio is not decoded yet, ffmpeg decodes it straight at the
+        sample rate and it is not kept as audio_data. Otherwise the audio already decoded is resampled if needed.
+
+        :param sample_rate: The desired sample rate
+        :return: The audio as an ndarray
+        """
+        if (
+            self._audio_data is None
+            and sample_rate != self.audio_sample_rate
+            and self._is_multimedia_loaded()
+            and self.is_multimedia()
+        ):
+            return AudioObject(self.path_to_raw_data, sample_rate=sample_rate).audio_data
+
+        audio_data = self.audio_data
+        if audio_data is None:
+            raise RuntimeError(f"No audio found in {self.path_to_raw_data}")
+
+        audio_data_sample_rate = self._get_audio_data_sample_rate()
+        if audio_data_sample_rate != sample_rate:
+            audio_data = librosa.resample(
+                audio_data, orig_sr=audio_data_sample_rate, target_sr=sample_rate
+            )
+        return audio_data
+
+    def _is_multimedia_loaded(self) -> bool:
+        if self.multimedia_metadata is None:
+            return self.load_multimedia().success
+        return True
+
+    def release_multimedia(self) -> None:
+        """Free the decoded audio and video. They will be decoded again if they are accessed."""
+        self._audio_data = None
+        self._audio_data_sample_rate = None
+        self._video_data = None
+
     @staticmethod
     def _validate_media(file_path) -> BasicResponse:
         try:
-            probe = ffmpeg.probe(file_path)
+            probe = probe_media(file_path)
             probe_score = probe.get("format", {}).get("probe_score", 0)
 
             if probe_score > 80 and probe:
@@ -225,7 +843,14 @@ class Multimedia(BaseModel):
 
         return multimedia_metadata
 
-    def load_multimedia(self) -> BasicResponse:
+    def load_multimedia(self, decode_payloads: bool = False) -> BasicResponse:
+        """
+        Validate the file and load its metadata. The audio and the video are decoded on first access to audio_data
+        and video_data, unless decode_payloads is True.
+
+        :param decode_payloads: Whether to decode the audio and the video right away
+        :return: A response with the result of the operation
+        """
         validation_response = self._validate_media(self.path_to_raw_data)
         validation_response.log_response(module="Multimedia", action="LoadRawData")
 
@@ -235,13 +860,9 @@ class Multimedia(BaseModel):
                     validation_response.data
                 )
 
-                if self.is_multimedia():
-                    audio_object = AudioObject(self.path_to_raw_data)
-                    self.audio_data = audio_object.audio_data
-
-                if self.is_video():
-                    video_object = VideoObject(self.path_to_raw_data)
-                    self.video_data = video_object.video_data
+                if decode_payloads:
+                    _ = self.audio_data
+                    _ = self.video_data
 
             except Exception as e:
                 validation_response = BasicResponse(
@@ -271,66 +892,56 @@ class Multimedia(BaseModel):
 
         return validation_response
 
-    def _estimate_snr_librosa(self) -> float:
-        """Estimates SNR of an audio file using librosa."""
-        if self.audio_data is None:
-            self.load_multimedia()
-
-        # Short-Time Energy (STE) Calculation
-        sample_rate = self.multimedia_metadata["audio-sample_rate"]
-        hop_length = int(sample_rate * self.hop_size_s)
-        frame_length = int(sample_rate * self.window_size_s)
-        energy = librosa.feature.rms(
-            y=self.audio_data, frame_length=frame_length, hop_length=hop_length
-        )
-
-        # Thresholding for Signal vs. Noise
-        threshold = np.percentile(
-            energy, self.threshold_snr
-        )  # Adjust percentile based on your audio characteristics
-        signal_frames = energy > threshold
-        noise_frames = energy <= threshold
-
-        # Estimate SNR in dB
-        signal_energy = np.mean(energy[signal_frames])
-        noise_energy = np.mean(energy[noise_frames])
-        snr = 10 * np.log10(signal_energy / noise_energy)
-
-        return snr
-
-    def _estimate_zero_crossings(self) -> np.ndarray:
-        if self.audio_data is None:
-            self.load_multimedia()
-
-        audio_as_ndarray = self.audio_data
-        zero_crossings = librosa.feature.zero_crossing_rate(audio_as_ndarray)
-
-        return zero_crossings
-
-    def calculate_audio_quality(self) -> BasicResponse:
-        if self.audio_data is None:
+    def calculate_audio_quality(
+        self, streaming: bool = False, block_duration_s: float = 60.0
+    ) -> BasicResponse:
+        """
+        Calculate the SNR, the zero-crossing rate and the rest of audio quality descriptors of the file, and add them
+        to the multimedia metadata.
+
+        :param streaming: Whether to decode and analyse the audio in blocks instead of using audio_data. The memory
+            used doesn't depend on the duration of the audio, and the SNR threshold is approximated
+        :param block_duration_s: The duration of each block in streaming mode
+        :return: A response with the audio quality descriptors
+        """
+        if self.multimedia_metadata is None:
             self.load_multimedia()
 
-        # Calculate SNR
-        try:
-            snr = self._estimate_snr_librosa()
-
-            dict_audio_quality = {"audio-SNR(dB)": snr}
-        except Exception as e:
-            dict_audio_quality = {"audio-SNR(dB)": None}
+        if streaming:
+            try:
+                dict_audio_quality = self._calculate_audio_quality_in_blocks(block_duration_s)
+            except Exception as e:
+                app_logger.error(f"Error calculating audio quality: {e}")
+                dict_audio_quality = {"audio-SNR(dB)": None, "audio-ZCR": None}
 
-            app_logger.error(f"Error calculating SNR: {e}")
+            self.multimedia_metadata.update(dict_audio_quality)
+            return DataResponse(
+                success=True,
+                status_code=200,
+                message="Audio quality calculated",
+                data=dict_audio_quality,
+            )
 
-        # Calculate zero crossings
+        # Calculate SNR, zero crossings and the rest of descriptors from a single framing of the audio
         try:
-            zero_crossings = self._estimate_zero_crossings()
-
-            dict_audio_quality["audio-ZCR_max "] = np.max(zero_crossings)
-            dict_audio_quality["audio-ZCR_min"] = np.min(zero_crossings)
-            dict_audio_quality["audio-ZCR_avg"] = np.mean(zero_crossings)
+            audio_data = self.audio_data
+            sample_rate = self._get_audio_data_sample_rate()
+            rms, zcr = calculate_frame_rms_and_zcr(
+                audio_data,
+                frame_length=int(sample_rate * self.window_size_s),
+                hop_length=int(sample_rate * self.hop_size_s),
+            )
+            dict_audio_quality = summarize_audio_quality(
+                rms,
+                zcr,
+                snr_threshold=self.threshold_snr,
+                peak=float(np.max(np.abs(audio_data))),
+                clipped_samples=int(np.count_nonzero(np.abs(audio_data) >= CLIPPING_LEVEL)),
+                number_of_samples=len(audio_data),
+            )
         except Exception as e:
-            app_logger.error(f"Error calculating zero crossings: {e}")
-            dict_audio_quality["audio-ZCR"] = None
+            app_logger.error(f"Error calculating audio quality: {e}")
+            dict_audio_quality = {"audio-SNR(dB)": None, "audio-ZCR": None}
 
         # Updata metadata only if audio quality is calculated
         self.multimedia_metadata.update(dict_audio_quality)
@@ -342,24 +953,60 @@ class Multimedia(BaseModel):
             data=dict_audio_quality,
         )
 
+    def _calculate_audio_quality_in_blocks(self, block_duration_s: float) -> dict:
+        audio_object = AudioObject(
+            self.path_to_raw_data, sample_rate=self.audio_sample_rate, load_audio_data=False
+        )
+        audio_quality = StreamingAudioQuality(
+            frame_length=int(audio_object.sample_rate * self.window_size_s),
+            hop_length=int(audio_object.sample_rate * self.hop_size_s),
+            snr_threshold=self.threshold_snr,
+        )
+        block_size = int(audio_object.sample_rate * block_duration_s)
+        for audio_block in audio_object.iter_audio_blocks(block_size):
+            audio_quality.update(audio_block)
+
+        return audio_quality.finish()
+
     def transcribe(self, language="es") -> BasicResponse:
-        if self.audio_data is None:
+        if self.multimedia_metadata is None:
             self.load_multimedia()
 
-        # Check for GPU availability
-        device = "cuda" if torch.cuda.is_available() else "cpu"
+        model_name = get_whisper_model_name(self.whisper_model_name, language)
 
-        if language == "en":
-            model = whisper.load_model("base.en", device=device)
-        else:
-            model = whisper.load_model("large", device=device)
+        # Whisper works on 16 kHz audio, the same array is hashed for the cache and transcribed
         try:
-            result = model.transcribe(str(self.path_to_raw_data))
+            audio_data = self.get_audio_data_at_sample_rate(whisper.audio.SAMPLE_RATE)
         except Exception as e:
             return BasicResponse(success=False, status_code=500, message=str(e))
 
+        transcription_cache, audio_hash, result = None, None, None
+        if self.path_to_transcription_cache is not None:
+            try:
+                audio_hash = calculate_audio_content_hash(audio_data, whisper.audio.SAMPLE_RATE)
+                transcription_cache = TranscriptionCache(str(self.path_to_transcription_cache))
+                result = transcription_cache.get_result(audio_hash, model_name, language)
+            except Exception as e:
+                app_logger.warning(f"Multimedia - Transcription cache not available: {e}")
+
+        try:
+            if result is None:
+                model = load_whisper_model(model_name)
+                result = model.transcribe(audio_data)
+
+                if transcription_cache is not None:
+                    transcription_cache.set_result(audio_hash, model_name, language, result)
+            else:
+                app_logger.info(f"Multimedia - Transcription of {self.path_to_raw_data} cached")
+        except Exception as e:
+            return BasicResponse(success=False, status_code=500, message=str(e))
+        finally:
+            if transcription_cache is not None:
+                transcription_cache.close()
+
         self.multimedia_metadata["transcription"] = result["text"]
         self.multimedia_metadata["transcription_language"] = result["language"]
+        self.multimedia_metadata["transcription_model"] = model_name
         return DataResponse(
             success=True, status_code=200, message="Transcription successful", data=result
         )
@@ -411,3 +1058,143 @@ class Multimedia(BaseModel):
             response = BasicResponse(success=False, status_code=500, message=str(e))
 
         return response
+
+
+def transcribe_multimedia_batch(
+    multimedia_objects: List[Multimedia],
+    language: str = "es",
+    model_name: str = None,
+    batch_size: int = 16,
+    path_to_transcription_cache: str = None,
+) -> ListResponse:
+    """
+    Transcribe many Multimedia objects at once. The audio_data of every object is cut into 30-second segments, and the
+    segments of all the objects are decoded together by whisper in batches of batch_size. The transcription and its
+    language are written into the multimedia_metadata of each object, as Multimedia.transcribe does.
+
+    Unlike Multimedia.transcribe, each segment is decoded on its own, without the text of the previous segment as
+    prompt, and the language of a file is the one detected on its first segment.
+
+    Example Usage
+    -------------
+        videos = [Multimedia(path_to_raw_data=path) for path in paths]
+        response = transcribe_multimedia_batch(videos, language="es")
+
+    :param multimedia_objects: The Multimedia objects to transcribe
+    :param language: The language of the files, used to pick the default model
+    :param model_name: The whisper model. None uses base.en for English and large for any other language
+    :param batch_size: The number of 30-second segments decoded per batch
+    :param path_to_transcription_cache: SQLite file where results are cached. None disables the cache
+    :return: A response with a list of results, one per object, with the text and the language or None on failure
+    """
+    model_name = get_whisper_model_name(model_name, language)
+
+    model = load_whisper_model(model_name)
+    decoding_options = whisper.DecodingOptions(
+        without_timestamps=True, fp16=model.device.type == "cuda"
+    )
+
+    transcription_cache = None
+    if path_to_transcription_cache is not None:
+        transcription_cache = TranscriptionCache(path_to_transcription_cache)
+    # The batched results differ from Multimedia.transcribe, so they are cached apart
+    cache_decoding_options = {"batch": True, "without_timestamps": True}
+
+    # Cut the audio of each object into 30-second segments of (object index, first sample)
+    audio_per_object, audio_hash_per_object, cached_results, segments = {}, {}, {}, []
+    for object_index, multimedia in enumerate(multimedia_objects):
+        try:
+            audio_data = multimedia.get_audio_data_at_sample_rate(whisper.audio.SAMPLE_RATE)
+        except Exception as e:
+            app_logger.error(f"Error loading audio of {multimedia.path_to_raw_data}: {e}")
+            continue
+
+        if transcription_cache is not None:
+            audio_hash = calculate_audio_content_hash(audio_data, whisper.audio.SAMPLE_RATE)
+            cached_result = transcription_cache.get_result(
+                audio_hash, model_name, language, cache_decoding_options
+            )
+            if cached_result is not None:
+                cached_results[object_index] = cached_result
+                continue
+            audio_hash_per_object[object_index] = audio_hash
+
+        audio_per_object[object_index] = audio_data
+        number_of_segments = max(1, math.ceil(len(audio_data) / whisper.audio.N_SAMPLES))
+        for segment_index in range(number_of_segments):
+            segments.append((object_index, segment_index * whisper.audio.N_SAMPLES))
+
+    # Decode the segments of all the objects in batches
+    texts_per_object = {object_index: [] for object_index in audio_per_object}
+    language_per_object = {}
+    for batch_start in range(0, len(segments), batch_size):
+        batch_segments = segments[batch_start : batch_start + batch_size]
+        mel_batch = torch.stack(
+            [
+                whisper.log_mel_spectrogram(
+                    whisper.pad_or_trim(
+                        audio_per_object[object_index][first_sample:][: whisper.audio.N_SAMPLES]
+                    ),
+                    n_mels=model.dims.n_mels,
+                    device=model.device,
+                )
+                for object_index, first_sample in batch_segments
+            ]
+        )
+
+        try:
+            decoding_results = whisper.decode(model, mel_batch, decoding_options)
+        except Exception as e:
+            app_logger.error(f"Error transcribing batch starting at segment {batch_start}: {e}")
+            for object_index, _ in batch_segments:
+                texts_per_object.pop(object_index, None)
+            continue
+
+        for (object_index, _), decoding_result in zip(batch_segments, decoding_results):
+            if object_index in texts_per_object:
+                texts_per_object[object_index].append(decoding_result.text)
+                language_per_object.setdefault(object_index, decoding_result.language)
+
+    results = []
+    for object_index, multimedia in enumerate(multimedia_objects):
+        if object_index in cached_results:
+            result = cached_results[object_index]
+        elif object_index in texts_per_object:
+            result = {
+                "text": " ".join(text for text in texts_per_object[object_index] if text),
+                "language": language_per_object[object_index],
+            }
+            if transcription_cache is not None:
+                transcription_cache.set_result(
+                    audio_hash_per_object[object_index],
+                    model_name,
+                    language,
+                    result,
+                    cache_decoding_options,
+                )
+        else:
+            results.append(None)
+            continue
+
+        multimedia.multimedia_metadata["transcription"] = result["text"]
+        multimedia.multimedia_metadata["transcription_language"] = result["language"]
+        multimedia.multimedia_metadata["transcription_model"] = model_name
+        results.append(result)
+
+    if transcription_cache is not None:
+        transcription_cache.close()
+
+    number_of_transcriptions = len(texts_per_object) + len(cached_results)
+    if number_of_transcriptions == len(multimedia_objects):
+        status_code = 200
+    elif number_of_transcriptions > 0:
+        status_code = 206
+    else:
+        status_code = 500
+
+    return ListResponse(
+        success=number_of_transcriptions > 0,
+        status_code=status_code,
+        message=f"Transcribed {number_of_transcriptions} of {len(multimedia_objects)} files",
+        data=results,
+    )
@@ -0,0 +1,270 @@
+import hashlib
+import json
+import os
+import sqlite3
+from pathlib import Path
+from typing import Optional
+
+from visia_science import app_logger
+
+
+def calculate_audio_content_hash(audio_data, sample_rate: int) -> str:
+    """
+    Calculate the hash of a decoded audio. Unlike a hash of the file, it doesn't change if the container of the audio
+    is re-muxed or its video stream is re-encoded.
+
+    :param audio_data: The decoded audio as an ndarray
+    :param sample_rate: The sample rate of the decoded audio
+    :return: The hex digest of the audio hash
+    """
+    audio_hash = hashlib.sha256(f"{sample_rate}-{audio_data.dtype}".encode())
+    audio_hash.update(memoryview(audio_data).cast("B"))
+    return audio_hash.hexdigest()
+
+
+def _metadata_value_to_json(value):
+    # numpy scalars (SNR, ZCR...) are not JSON serializable
+    if hasattr(value, "item"):
+        return value.item()
+    return str(value)
+
+
+class MultimediaMetadataIndex:
+    """
+    Persistent SQLite index with the standardized metadata of each multimedia file. Each row is keyed by the file path
+    and stores the size and mtime of the file when it was processed, so later runs only need to process new or modified
+    files. Any change of the mtime counts as a modification: a file edited in place can keep its size and the bytes of
+    its container headers, so its content can't be checked without reading all of it.
+
+    Example Usage
+    -------------
+        index = MultimediaMetadataIndex(path_to_index="metadata_all_videos.sqlite")
+        metadata = index.get_metadata(video_file_path)
+        if metadata is None:
+            metadata = process(video_file_path)
+            index.set_metadata(video_file_path, metadata)
+        index.close()
+    """
+
+    def __init__(self, path_to_index: str):
+        self.path_to_index = path_to_index
+
+        if os.path.dirname(path_to_index) != "":
+            os.makedirs(os.path.dirname(path_to_index), exist_ok=True)
+
+        self.connection = sqlite3.connect(path_to_index)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS multimedia_metadata ("
+            "file_path TEXT PRIMARY KEY, "
+            "size INTEGER NOT NULL, "
+            "mtime_ns INTEGER NOT NULL, "
+            "metadata TEXT NOT NULL)"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def _file_key(file_path) -> str:
+        return str(Path(file_path).resolve())
+
+    def get_metadata(self, file_path) -> Optional[dict]:
+        """
+        Return the cached metadata of a file, or None if the file is new or its size or mtime changed since it was
+        indexed.
+
+        :param file_path: The path to the multimedia file
+        :return: The cached metadata as a dict or None
+        """
+        row = self.connection.execute(
+            "SELECT size, mtime_ns, metadata FROM multimedia_metadata WHERE file_path = ?",
+            (self._file_key(file_path),),
+        ).fetchone()
+        if row is None:
+            return None
+
+        size, mtime_ns, metadata = row
+        file_stat = os.stat(file_path)
+        if file_stat.st_size == size and file_stat.st_mtime_ns == mtime_ns:
+            return json.loads(metadata)
+
+        app_logger.info(f"MultimediaIndex - File {file_path} changed since it was indexed")
+        return None
+
+    def set_metadata(self, file_path, metadata: dict) -> None:
+        file_stat = os.stat(file_path)
+        self.connection.execute(
+            "INSERT OR REPLACE INTO multimedia_metadata "
+            "(file_path, size, mtime_ns, metadata) VALUES (?, ?, ?, ?)",
+            (
+                self._file_key(file_path),
+                file_stat.st_size,
+                file_stat.st_mtime_ns,
+                json.dumps(metadata, default=_metadata_value_to_json),
+            ),
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class TranscriptionCache:
+    """
+    Persistent SQLite cache with the whisper results of each audio. Each result is keyed by the hash of the decoded
+    audio, the whisper model, the language and the decoding options used to transcribe it.
+
+    Example Usage
+    -------------
+        transcription_cache = TranscriptionCache(path_to_cache="transcriptions.sqlite")
+        result = transcription_cache.get_result(audio_hash, "large", "es")
+        if result is None:
+            result = model.transcribe(audio)
+            transcription_cache.set_result(audio_hash, "large", "es", result)
+        transcription_cache.close()
+    """
+
+    def __init__(self, path_to_cache: str):
+        self.path_to_cache = path_to_cache
+
+        if os.path.dirname(path_to_cache) != "":
+            os.makedirs(os.path.dirname(path_to_cache), exist_ok=True)
+
+        # Pool workers may write to the same cache, wait for their locks instead of failing
+        self.connection = sqlite3.connect(path_to_cache, timeout=60)
+        self.connection.execute(
+            "CREATE TABLE IF NOT EXISTS transcriptions ("
+            "audio_hash TEXT NOT NULL, "
+            "model_name TEXT NOT NULL, "
+            "language TEXT NOT NULL, "
+            "decoding_options TEXT NOT NULL, "
+            "result TEXT NOT NULL, "
+            "PRIMARY KEY (audio_hash, model_name, language, decoding_options))"
+        )
+        self.connection.commit()
+
+    @staticmethod
+    def _decoding_options_key(decoding_options: dict = None) -> str:
+        return json.dumps(decoding_options or {}, sort_keys=True, default=str)
+
+    def get_result(
+        self, audio_hash: str, model_name: str, language: str, decoding_options: dict = None
+    ) -> Optional[dict]:
+        row = self.connection.execute(
+            "SELECT result FROM transcriptions "
+            "WHERE audio_hash = ? AND model_name = ? AND language = ? AND decoding_options = ?",
+            (audio_hash, model_name, str(language), self._decoding_options_key(decoding_options)),
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0])
+
+    def set_result(
+        self,
+        audio_hash: str,
+        model_name: str,
+        language: str,
+        result: dict,
+        decoding_options: dict = None,
+    ) -> None:
+        self.connection.execute(
+            "INSERT OR REPLACE INTO transcriptions "
+            "(audio_hash, model_name, language, decoding_options, result) VALUES (?, ?, ?, ?, ?)",
+            (
+                audio_hash,
+                model_name,
+                str(language),
+                self._decoding_options_key(decoding_options),
+                json.dumps(result, default=_metadata_value_to_json),
+            ),
+        )
+        self.connection.commit()
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class MetadataCheckpoint:
+    """
+    Append-only JSON lines file with the metadata of the files already processed by a run, so a run that crashed can be
+    resumed from the last completed file. Records are buffered and appended in batches of batch_size, each batch is
+    flushed to disk with fsync. A line cut by a crash is ignored when the checkpoint is loaded.
+
+    Example Usage
+    -------------
+        checkpoint = MetadataCheckpoint(path_to_checkpoint="metadata_all_videos.checkpoint.jsonl")
+        metadata_per_file = checkpoint.load_records()
+        for file_path in files_to_process:
+            if file_path not in metadata_per_file:
+                checkpoint.add_record(file_path, process(file_path))
+        checkpoint.flush()
+        checkpoint.remove()
+    """
+
+    def __init__(self, path_to_checkpoint: str, batch_size: int = 50):
+        self.path_to_checkpoint = path_to_checkpoint
+        self.batch_size = batch_size
+        self._pending_lines = []
+
+        if os.path.dirname(path_to_checkpoint) != "":
+            os.makedirs(os.path.dirname(path_to_checkpoint), exist_ok=True)
+
+    def load_records(self) -> dict:
+        """
+        Load the records of a previous run. Records of files that changed or disappeared since then are discarded.
+
+        :return: A dict with the file paths as keys and their metadata as values
+        """
+        records = {}
+        if not os.path.exists(self.path_to_checkpoint):
+            return records
+
+        with open(self.path_to_checkpoint, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    checkpoint_line = json.loads(line)
+                except json.JSONDecodeError:
+                    app_logger.warning(
+                        f"MetadataCheckpoint - Skipping a truncated line: {line[:80]}"
+                    )
+                    continue
+
+                file_path = checkpoint_line["file_path"]
+                try:
+                    file_stat = os.stat(file_path)
+                except OSError:
+                    continue
+                if (
+                    file_stat.st_size == checkpoint_line["size"]
+                    and file_stat.st_mtime_ns == checkpoint_line["mtime_ns"]
+                ):
+                    records[file_path] = checkpoint_line["metadata"]
+
+        app_logger.info(f"MetadataCheckpoint - Resuming from {len(records)} processed files")
+        return records
+
+    def add_record(self, file_path: str, metadata: dict) -> None:
+        file_stat = os.stat(file_path)
+        checkpoint_line = {
+            "file_path": file_path,
+            "size": file_stat.st_size,
+            "mtime_ns": file_stat.st_mtime_ns,
+            "metadata": metadata,
+        }
+        self._pending_lines.append(json.dumps(checkpoint_line, default=_metadata_value_to_json))
+
+        if len(self._pending_lines) >= self.batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self._pending_lines:
+            return
+
+        with open(self.path_to_checkpoint, "a", encoding="utf-8") as file:
+            file.write("\n".join(self._pending_lines) + "\n")
+            file.flush()
+            os.fsync(file.fileno())
+        self._pending_lines = []
+
+    def remove(self) -> None:
+        self._pending_lines = []
+        if os.path.exists(self.path_to_checkpoint):
+            os.remove(self.path_to_checkpoint)
@@ -1,8 +1,83 @@
+from collections.abc import Mapping
 from enum import Enum
+from typing import Iterable, Iterator, List
 
+import numpy as np
+import pandas as pd
 from pydantic import BaseModel
 
 
+class CategoryNormalizer:
+    """
+    Maps the free-text answers of a questionary to the canonical values of an Enum. An answer takes the first
+    category, in the given order, whose value contains the lowercase answer, e.g. "G1" -> "G1-clínico-S". Answers
+    that match no category take the unknown one.
+
+    The canonical values are in the lookup table from the start, and every new answer is resolved once and added to
+    it, so the questionaries, that repeat the same few answers across many rows, never resolve the same answer twice.
+
+    :param categories: The categories to match, in the order they are tested
+    :param unknown: The category of the answers that match no other category
+    :param upper: Whether the canonical values are returned in upper case
+    """
+
+    def __init__(self, categories: List[Enum], unknown: Enum, upper: bool = False):
+        self.categories = categories
+        self.unknown = unknown
+        self.upper = upper
+
+        self.canonical_values = [
+            self._canonical_value(category) for category in categories + [unknown]
+        ]
+        self._canonical_codes = {value: code for code, value in enumerate(self.canonical_values)}
+        self._lookup_table: dict = {}
+        for category in categories:
+            for answer in (category.value, category.value.lower(), category.value.upper()):
+                self._lookup_table.setdefault(answer, self._resolve(answer))
+
+    def _canonical_value(self, category: Enum) -> str:
+        return category.value.upper() if self.upper else category.value
+
+    def _resolve(self, answer: str) -> str:
+        answer = answer.lower()
+        for category in self.categories:
+            if answer in category.value.lower():
+                return self._canonical_value(category)
+        return self._canonical_value(self.unknown)
+
+    def __call__(self, answer: str) -> str:
+        if not isinstance(answer, str):
+            return self._canonical_value(self.unknown)
+
+        canonical_value = self._lookup_table.get(answer)
+        if canonical_value is None:
+            canonical_value = self._lookup_table[answer] = self._resolve(answer)
+        return canonical_value
+
+    def normalize_series(self, answers: pd.Series) -> pd.Series:
+        """
+        Normalizes a column of answers. Each distinct answer is resolved once, through the categories of a
+        categorical dtype, and missing answers take the unknown category.
+
+        :param answers: The column with the answers
+        :return: A categorical column with the canonical values, with the same index and name as the answers
+        """
+        answers = answers.astype("category")
+        unknown_code = len(self.canonical_values) - 1
+        canonical_codes = np.array(
+            [self._canonical_codes[self(answer)] for answer in answers.cat.categories]
+            + [unknown_code],
+            dtype=np.int64,
+        )
+        # A missing answer has code -1, so it takes the last code, the one of the unknown category
+        codes = canonical_codes[answers.cat.codes.to_numpy()]
+        return pd.Series(
+            pd.Categorical.from_codes(codes, categories=self.canonical_values),
+            index=answers.index,
+            name=answers.name,
+        )
+
+
 class VisiaGroup(Enum):
     GROUP_1: str = "G1-clínico-S"
     GROUP_2: str = "G2-clínico-N"
@@ -10,15 +85,13 @@ class VisiaGroup(Enum):
     UNK: str = "UNK"
 
 
+VISIA_GROUP_NORMALIZER = CategoryNormalizer(
+    [VisiaGroup.GROUP_1, VisiaGroup.GROUP_2, VisiaGroup.GROUP_3], VisiaGroup.UNK
+)
+
+
 def return_visia_group(input_value: str):
-    if input_value.lower() in VisiaGroup.GROUP_1.value.lower():
-        return VisiaGroup.GROUP_1.value
-    elif input_value.lower() in VisiaGroup.GROUP_2.value.lower():
-        return VisiaGroup.GROUP_2.value
-    elif input_value.lower() in VisiaGroup.GROUP_3.value.lower():
-        return VisiaGroup.GROUP_3.value
-    else:
-        return VisiaGroup.UNK.value
+    return VISIA_GROUP_NORMALIZER(input_value)
 
 
 class Education(Enum):
@@ -29,17 +102,15 @@ class Education(Enum):
     UNK: str = "UNK"
 
 
+EDUCATION_NORMALIZER = CategoryNormalizer(
+    [Education.PRIMARY, Education.SECONDARY, Education.BACHELOR, Education.PROFESSIONAL],
+    Education.UNK,
+    upper=True,
+)
+
+
 def return_education_level(input_value: str):
-    if input_value.lower() in Education.PRIMARY.value.lower():
-        return Education.PRIMARY.value.upper()
-    elif input_value.lower() in Education.SECONDARY.value.lower():
-        return Education.SECONDARY.value.upper()
-    elif input_value.lower() in Education.BACHELOR.value.lower():
-        return Education.BACHELOR.value.upper()
-    elif input_value.lower() in Education.PROFESSIONAL.value.lower():
-        return Education.PROFESSIONAL.value.upper()
-    else:
-        return Education.UNK.value.upper()
+    return EDUCATION_NORMALIZER(input_value)
 
 
 class Sex(Enum):
@@ -48,13 +119,11 @@ class Sex(Enum):
     UNK: str = "UNK"
 
 
+SEX_NORMALIZER = CategoryNormalizer([Sex.MALE, Sex.FEMALE], Sex.UNK, upper=True)
+
+
 def return_sex(input_value: str):
-    if input_value.lower() in Sex.MALE.value.lower():
-        return Sex.MALE.value.upper()
-    elif input_value.lower() in Sex.FEMALE.value.lower():
-        return Sex.FEMALE.value.upper()
-    else:
-        return Sex.UNK.value.upper()
+    return SEX_NORMALIZER(input_value)
 
 
 class Patient(BaseModel):
@@ -70,3 +139,110 @@ class Patient(BaseModel):
 
     class Config:
         arbitrary_types_allowed = True
+
+
+class PatientTable(Mapping):
+    """
+    A columnar store of patients, with one array per field of Patient instead of one Patient object per patient.
+    The sex, clinical group, education level and city are stored as categorical columns. The fields are validated once
+    per column when the table is built, so exporting the table to a DataFrame copies no data and validates nothing.
+
+    The table is a read-only mapping from patient ID to patient, like the dict of Patient objects it replaces. A
+    Patient is only built when a patient is looked up.
+
+    Example Usage
+    -------------
+        patients = PatientTable.from_dataframe(df_patients)
+        patient = patients["CUNQ-001"]
+        df_patients = patients.to_dataframe()
+
+    :param columns: A dict with a 1-D array for each field of Patient, all of the same length and without duplicated IDs
+    """
+
+    CATEGORICAL_FIELDS = ["sex", "education_level", "clinical_group", "city"]
+    TEXT_FIELDS = ["id", "diagnosis", "treatment"]
+
+    def __init__(self, columns: dict):
+        self._columns = {field: columns[field] for field in Patient.model_fields}
+        self._positions = {
+            patient_id: position for position, patient_id in enumerate(self._columns["id"])
+        }
+
+    @classmethod
+    def from_dataframe(cls, df_patients: pd.DataFrame) -> "PatientTable":
+        """
+        Builds the table from a DataFrame with a column for each field of Patient. A repeated ID keeps the values of
+        its last row at the position of its first one.
+
+        :param df_patients: The DataFrame with the patients
+        :return: A PatientTable with the patients of the DataFrame
+        :raises ValueError: If a field is not in the DataFrame or has missing values
+        """
+        missing_fields = [
+            field for field in Patient.model_fields if field not in df_patients.columns
+        ]
+        if missing_fields:
+            raise ValueError(f"PatientTable - Missing the fields {missing_fields}")
+        df_patients = df_patients[list(Patient.model_fields)]
+
+        fields_with_missing_values = df_patients.columns[df_patients.isna().any()].tolist()
+        if fields_with_missing_values:
+            raise ValueError(
+                f"PatientTable - Missing values in the fields {fields_with_missing_values}"
+            )
+
+        if df_patients["id"].duplicated().any():
+            df_patients = df_patients.groupby("id", sort=False).last().reset_index()
+        columns = {}
+        for field in Patient.model_fields:
+            column = df_patients[field]
+            if field in cls.CATEGORICAL_FIELDS:
+                columns[field] = pd.Categorical(column.astype(str))
+            elif field in cls.TEXT_FIELDS:
+                columns[field] = column.astype(str).to_numpy(dtype=object)
+            elif field == "age":
+                columns[field] = column.to_numpy(dtype=np.int64)
+            else:
+                columns[field] = column.to_numpy(dtype=bool)
+        return cls(columns)
+
+    @classmethod
+    def from_patients(cls, patients: Iterable[Patient]) -> "PatientTable":
+        """
+        Builds the table from Patient objects.
+
+        :param patients: The Patient objects
+        :return: A PatientTable with the patients
+        """
+        return cls.from_dataframe(
+            pd.DataFrame(
+                [patient.model_dump() for patient in patients], columns=list(Patient.model_fields)
+            )
+        )
+
+    def __getitem__(self, patient_id: str) -> Patient:
+        position = self._positions[patient_id]
+        fields = {}
+        for field, column in self._columns.items():
+            value = column[position]
+            fields[field] = value.item() if isinstance(value, np.generic) else value
+        # The columns were validated when the table was built
+        return Patient.model_construct(**fields)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._positions)
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, patient_id) -> bool:
+        return patient_id in self._positions
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """
+        Exports the table to a DataFrame indexed by patient ID, with a column for each field of Patient. The columns
+        share the arrays of the table, no data is copied.
+
+        :return: A DataFrame with the patients
+        """
+        return pd.DataFrame(self._columns, index=pd.Index(self._columns["id"]), copy=False)
@@ -1,15 +1,100 @@
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
+from typing import Optional
 
+import numpy as np
 import pandas as pd
-from pydantic import BaseModel
+from pydantic import BaseModel, PrivateAttr
 
 from visia_science import app_logger
 from visia_science.data import QuestionaryError
-from visia_science.files import load_json_as_dict, save_dict_as_json
+from visia_science.files import load_json_as_dict, save_dataframe, save_dict_as_json
 
 SUPPORTED_QUESTIONARIES_EXTENSIONS = [".csv"]
+# Column of the raw data with the name of the file each row was read from
+SOURCE_FILE_COLUMN = "source_file"
+
+# Parsed questionary files, keyed by (resolved path, loading arguments, columns to load). Each entry keeps the size
+# and mtime of the file when it was parsed, so a file that changes on disk is parsed again
+_RAW_TABLE_CACHE: dict = {}
+
+# pd.read_csv arguments that don't change how the header of a file is parsed
+_ARGUMENTS_NOT_NEEDED_FOR_HEADER = ["dtype", "dtype_backend", "engine", "nrows", "usecols"]
+
+
+def _loading_arguments_key(loading_arguments: dict) -> str:
+    return repr(
+        sorted(
+            (argument, sorted(value.items()) if isinstance(value, dict) else value)
+            for argument, value in loading_arguments.items()
+        )
+    )
+
+
+def read_raw_table(
+    file_path, loading_arguments: dict = None, columns_to_load: list = None
+) -> pd.DataFrame:
+    """
+    Runs pd.read_csv over a questionary file and caches the result. Several questionaries of the config are stored in
+    the same file (e.g. EBIP and ECIP), so each file is parsed once per run and every questionary takes the columns it
+    needs from the same table.
+
+    If columns_to_load is given, only those columns are parsed, the rest of the file is never materialized. Columns
+    that are not in the file are ignored.
+
+    The returned table is shared by all the questionaries, it must not be modified in place.
+
+    :param file_path: The path to the questionary file
+    :param loading_arguments: Keyword arguments for pd.read_csv (e.g. dtype or engine="pyarrow")
+    :param columns_to_load: The columns to parse. None parses all the columns
+    :return: The parsed file as a DataFrame
+    """
+    if loading_arguments is None:
+        loading_arguments = {}
+
+    file_stat = os.stat(file_path)
+    cache_key = (
+        str(Path(file_path).resolve()),
+        _loading_arguments_key(loading_arguments),
+        None if columns_to_load is None else tuple(sorted(set(columns_to_load))),
+    )
+
+    cached_table = _RAW_TABLE_CACHE.get(cache_key)
+    if cached_table is not None:
+        size, mtime_ns, df_raw_table = cached_table
+        if file_stat.st_size == size and file_stat.st_mtime_ns == mtime_ns:
+            app_logger.info(f"Questionary - File {file_path} found in the raw table cache")
+            return df_raw_table
+
+    if columns_to_load is not None:
+        # Read the header to only ask for the columns in the file, read_csv fails on missing ones
+        header_arguments = {
+            argument: value
+            for argument, value in loading_arguments.items()
+            if argument not in _ARGUMENTS_NOT_NEEDED_FOR_HEADER
+        }
+        columns_in_file = pd.read_csv(file_path, nrows=0, **header_arguments).columns
+        columns_to_load = set(columns_to_load)
+        usecols = [column for column in columns_in_file if column in columns_to_load]
+
+        loading_arguments = {**loading_arguments, "usecols": usecols}
+        if isinstance(loading_arguments.get("dtype"), dict):
+            loading_arguments["dtype"] = {
+                column: dtype
+                for column, dtype in loading_arguments["dtype"].items()
+                if column in usecols
+            }
+
+    df_raw_table = pd.read_csv(file_path, **loading_arguments)
+    _RAW_TABLE_CACHE[cache_key] = (file_stat.st_size, file_stat.st_mtime_ns, df_raw_table)
+    return df_raw_table
+
+
+def clear_raw_table_cache() -> None:
+    _RAW_TABLE_CACHE.clear()
 
 
 class BaseQuestionary(BaseModel):
@@ -22,6 +107,11 @@ class BaseQuestionary(BaseModel):
     column_with_date: str
     columns_with_items: list
     columns_with_scores: list
+    # Optional dtypes of the columns when they are loaded, e.g. {"Sexo": "category", "Score": "float"}
+    column_dtypes: Optional[dict] = None
+
+    # Format of the processed tables: "csv", "parquet" or "feather"
+    output_format: str = "csv"
 
     df_raw_data: pd.DataFrame = pd.DataFrame()
     df_post_processed_data: pd.DataFrame = pd.DataFrame()
@@ -29,16 +119,19 @@ class BaseQuestionary(BaseModel):
     class Config:
         arbitrary_types_allowed = True
 
+    def get_columns_to_keep(self) -> list:
+        return (
+            self.columns_with_items
+            + self.columns_with_scores
+            + [self.column_with_id, self.column_with_date]
+        )
+
     def _make_post_processed_data(self) -> pd.DataFrame:
         # Create a copy of the raw data
         df_with_desired_columns = self.df_raw_data.copy(deep=False)
 
         # Remove columns that are not in columns_with_items or columns_with_scores
-        columns_to_keep = (
-            self.columns_with_items
-            + self.columns_with_scores
-            + [self.column_with_id, self.column_with_date]
-        )
+        columns_to_keep = self.get_columns_to_keep()
         columns_to_drop = [
             col for col in df_with_desired_columns.columns if col not in columns_to_keep
         ]
@@ -50,20 +143,49 @@ class BaseQuestionary(BaseModel):
             app_logger.info("Questionary - No post-processed data found. Creating it now.")
             self.df_post_processed_data = self._make_post_processed_data()
 
-    def load_raw_data(self, loading_arguments: dict = None) -> pd.DataFrame:
+    def _read_file_columns(
+        self, file_name: Path, loading_arguments: dict, columns_to_load: list
+    ) -> pd.DataFrame:
+        # The parsed file is shared, take a copy of the columns of this questionary
+        columns_to_keep = set(self.get_columns_to_keep())
+        df_raw_table = read_raw_table(file_name, loading_arguments, columns_to_load)
+        return df_raw_table[
+            [column for column in df_raw_table.columns if column in columns_to_keep]
+        ]
+
+    def load_raw_data(
+        self, loading_arguments: dict = None, columns_to_load: list = None, max_workers: int = 1
+    ) -> pd.DataFrame:
+        """
+        Load the files of the questionary into df_raw_data. Only the id, date, items and scores columns are parsed,
+        with the dtypes in column_dtypes unless loading_arguments has its own dtype.
+
+        Every file matching *q_file_name_to_search* (e.g. one export per collection wave) is read, in order of file
+        name, and the files are concatenated once. The SOURCE_FILE_COLUMN column records the file of each row.
+
+        Questionaries stored in the same file should pass the same loading_arguments and columns_to_load (the union of
+        their columns), so the file is parsed once and shared between them.
+
+        :param loading_arguments: Keyword arguments for pd.read_csv (e.g. engine="pyarrow")
+        :param columns_to_load: The columns parsed from the file (default, the columns of the questionary)
+        :param max_workers: The number of threads reading files at once. 1 reads them one after the other
+        :return: The raw data of the questionary
+        """
         if loading_arguments is None:
             loading_arguments = {}
+        if self.column_dtypes and "dtype" not in loading_arguments:
+            loading_arguments = {**loading_arguments, "dtype": self.column_dtypes}
+        if columns_to_load is None:
+            columns_to_load = self.get_columns_to_keep()
 
         try:
-            for file_name in self.path_to_load_data.glob(f"*{self.q_file_name_to_search.name}*"):
-                if file_name.suffix == ".csv":
-                    df_file_data = pd.read_csv(file_name, **loading_arguments)
-                    self.df_raw_data = pd.concat(
-                        [df_file_data, self.df_raw_data], ignore_index=True, sort=False
-                    )
-                else:
+            file_names = sorted(
+                self.path_to_load_data.glob(f"*{self.q_file_name_to_search.name}*")
+            )
+            for file_name in file_names:
+                if file_name.suffix not in SUPPORTED_QUESTIONARIES_EXTENSIONS:
                     message = (
-                        f"Unsupported extension {self.q_file_name_to_search.suffix}."
+                        f"Unsupported extension {file_name.suffix}."
                         f" Supported extensions are: {SUPPORTED_QUESTIONARIES_EXTENSIONS}"
                     )
                     app_logger.error(message)
@@ -71,6 +193,16 @@ class BaseQuestionary(BaseModel):
                         message,
                         error_type="UnsupportedExtensionError",
                     )
+
+            def read_file(file_name: Path) -> pd.DataFrame:
+                return self._read_file_columns(file_name, loading_arguments, columns_to_load)
+
+            if max_workers > 1 and len(file_names) > 1:
+                # map keeps the order of the files whatever the order in which the threads finish
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    files_data = list(executor.map(read_file, file_names))
+            else:
+                files_data = [read_file(file_name) for file_name in file_names]
         except Exception as e:
             message = f"Error while reading file {self.q_file_name_to_search}: {e}"
             app_logger.error(message)
@@ -79,6 +211,23 @@ class BaseQuestionary(BaseModel):
                 error_type="FileReadError",
             )
 
+        if not files_data:
+            app_logger.warning(f"Questionary - No files found for {self.q_file_name_to_search}")
+            return self.df_raw_data
+
+        df_raw_data = pd.concat(files_data, ignore_index=True, sort=False)
+
+        # Categories of each file may differ, concat falls back to object in that case
+        for column, dtype in files_data[0].dtypes.items():
+            if isinstance(dtype, pd.CategoricalDtype) and df_raw_data[column].dtype == "object":
+                df_raw_data[column] = df_raw_data[column].astype("category")
+
+        df_raw_data[SOURCE_FILE_COLUMN] = pd.Categorical.from_codes(
+            np.repeat(np.arange(len(files_data)), [len(df) for df in files_data]),
+            categories=[file_name.name for file_name in file_names],
+        )
+
+        self.df_raw_data = df_raw_data
         return self.df_raw_data
 
     @staticmethod
@@ -92,11 +241,40 @@ class BaseQuestionary(BaseModel):
     def _standardize_date_column_to_datetime(
         self, df_with_dates: pd.DataFrame, month_mapping: dict, date_time_format: str
     ) -> pd.DataFrame:
-        for index, date_string in df_with_dates[self.column_with_date].items():
-            date_object = self._standardize_datetime(date_string, month_mapping, date_time_format)
-            df_with_dates.loc[index, self.column_with_date] = date_object
+        """
+        Parse the date column of the questionary as datetime, translating the month prefix of each date with
+        month_mapping. All the rows are parsed at once. Rows with a date that can't be parsed are reported and removed,
+        they would never pass the date filters of the cleaning.
+
+        :param df_with_dates: The questionary with the date column as strings
+        :param month_mapping: A dict from the month prefix in the data to the month prefix of the format
+        :param date_time_format: The format of the dates after translating the month
+        :return: The questionary with the date column as datetime
+        """
+        date_strings = df_with_dates[self.column_with_date]
+        if pd.api.types.is_datetime64_any_dtype(date_strings):
+            return df_with_dates
+
+        date_strings = date_strings.astype("string")
+        month_prefixes = date_strings.str[:3]
+        translated_dates = month_prefixes.map(month_mapping).fillna(month_prefixes) + (
+            date_strings.str[3:]
+        )
+        dates = pd.to_datetime(translated_dates, format=date_time_format, errors="coerce")
+
+        unparseable_dates = dates.isna()
+        if unparseable_dates.any():
+            rows_with_unparseable_dates = df_with_dates.loc[
+                unparseable_dates, [self.column_with_id, self.column_with_date]
+            ]
+            app_logger.warning(
+                f"Questionary - Removing {len(rows_with_unparseable_dates)} rows of {self.q_name} with a date"
+                f" that can't be parsed: {rows_with_unparseable_dates.to_dict('records')}"
+            )
+            df_with_dates = df_with_dates[~unparseable_dates].copy()
+            dates = dates[~unparseable_dates]
 
-        df_with_dates[self.column_with_date] = pd.to_datetime(df_with_dates[self.column_with_date])
+        df_with_dates[self.column_with_date] = dates
         return df_with_dates
 
     def _standardize_empty_values(self, df_with_empty_values: pd.DataFrame) -> pd.DataFrame:
@@ -104,16 +282,20 @@ class BaseQuestionary(BaseModel):
         columns_with_empty_rows = df_with_empty_values.columns[
             df_with_empty_values.isna().any()
         ].tolist()
-        columns_with_empty_rows.append(
-            df_with_empty_values.columns[df_with_empty_values.isnull().any()].tolist()
-        )
 
         # Fill NaN values with -1 if the column is a score column and with "No answer" if it is an item column
         for column in columns_with_empty_rows:
-            if column in self.columns_with_scores:
-                df_with_empty_values[column] = df_with_empty_values[column].fillna(-1)
-            else:
-                df_with_empty_values[column] = df_with_empty_values[column].fillna("No answer")
+            fill_value = -1 if column in self.columns_with_scores else "No answer"
+
+            # Categorical columns (see column_dtypes) need the fill value as a category
+            column_values = df_with_empty_values[column]
+            if (
+                isinstance(column_values.dtype, pd.CategoricalDtype)
+                and fill_value not in column_values.cat.categories
+            ):
+                column_values = column_values.cat.add_categories([fill_value])
+
+            df_with_empty_values[column] = column_values.fillna(fill_value)
         return df_with_empty_values
 
     def _remove_entries_from_a_given_date(
@@ -232,8 +414,8 @@ class BaseQuestionary(BaseModel):
     def save_q_processed(self):
         self.create_simple_post_processed_if_dont_exits()
 
-        path_to_save = os.path.join(self.path_to_save_data, f"{self.q_name}_processed.csv")
-        self.df_post_processed_data.to_csv(path_to_save, index=False)
+        path_to_save = os.path.join(self.path_to_save_data, f"{self.q_name}_processed")
+        save_dataframe(self.df_post_processed_data, path_to_save, output_format=self.output_format)
 
     def get_ids(self):
         return self.df_raw_data[self.column_with_id].unique()
@@ -247,6 +429,12 @@ class BaseQuestionary(BaseModel):
 
 class VisiaQuestionary(BaseQuestionary):
     ID_WITH_WRONG_FORMAT: dict = None
+    # Ask in the terminal for the correction of IDs with a wrong format. If False, they are only reported
+    ask_for_unknown_ids: bool = False
+
+    # Row positions of each patient in df_post_processed_data, and the data and id column they were built for
+    _patient_index: dict = PrivateAttr(default=None)
+    _patient_index_key: tuple = PrivateAttr(default=None)
 
     ID_FORMAT: list = ["CUNQ-", "CHUO0", "OU-"]
     DATE_TIME_FORMAT: str = "%b %d, %Y @ %I:%M %p"
@@ -272,11 +460,14 @@ class VisiaQuestionary(BaseQuestionary):
     def extract_metadata(self):
         pass
 
-    def _load_json_with_wrong_ids(self) -> dict:
-        path_to_ids_with_wrong_format = os.path.join(
+    def _get_path_to_ids_with_wrong_format(self) -> str:
+        return os.path.join(
             os.path.dirname(self.q_file_name_to_search), "visia_ids_with_wrong_format.json"
         )
 
+    def _load_json_with_wrong_ids(self) -> dict:
+        path_to_ids_with_wrong_format = self._get_path_to_ids_with_wrong_format()
+
         try:
             if self.ID_WITH_WRONG_FORMAT is None:
                 dict_with_wrong_ids = load_json_as_dict(path_to_ids_with_wrong_format)
@@ -291,38 +482,73 @@ class VisiaQuestionary(BaseQuestionary):
 
         return dict_with_wrong_ids
 
+    def _ask_for_the_correct_ids(self, unresolved_ids: list) -> None:
+        for raw_id in unresolved_ids:
+            usr_answer = input(f"Is the ID {raw_id} correct? (y/n): ")
+            if usr_answer.lower() == "n":
+                correct_id = input("Please enter the correct ID: ")
+            else:
+                correct_id = raw_id
+
+            # Save the correct ID for future reference
+            self.ID_WITH_WRONG_FORMAT[raw_id] = correct_id
+
     def _standardize_ids(self, df_with_ids, id_examples: list = None):
+        """
+        Replace the IDs that don't match any of the id_examples with their correction from
+        visia_ids_with_wrong_format.json. All the IDs are checked and corrected at once.
+
+        IDs without a correction are kept as they are and reported in {q_name}_ids_unresolved.json, next to the file
+        with the corrections, with the number of rows of each one. If ask_for_unknown_ids is True, the user is asked
+        for the correction of each unresolved ID instead, and the new corrections are saved once at the end.
+
+        :param df_with_ids: The questionary with the column_with_id
+        :param id_examples: Substrings of the valid IDs (default ["CUNQ-0", "CHOU-0", "OU-0"])
+        :return: The questionary with the corrected IDs
+        """
         if id_examples is None:
             id_examples = ["CUNQ-0", "CHOU-0", "OU-0"]
 
         self.ID_WITH_WRONG_FORMAT = self._load_json_with_wrong_ids()
 
         # Check if the IDs are in the correct format
-        path_to_ids_with_wrong_format = os.path.join(
-            os.path.dirname(self.q_file_name_to_search), "visia_ids_with_wrong_format.json"
+        raw_ids = df_with_ids[self.column_with_id]
+        id_pattern = "|".join(re.escape(example) for example in id_examples)
+        has_wrong_format = ~(
+            raw_ids.astype("string").str.contains(id_pattern, regex=True).fillna(False).to_numpy()
         )
-        for index, raw_id in df_with_ids[self.column_with_id].items():
-            if not any([example in raw_id for example in id_examples]):
-                # Check if the ID is already in the wrong format
-                if raw_id in self.ID_WITH_WRONG_FORMAT:
-                    correct_id = self.ID_WITH_WRONG_FORMAT[raw_id]
-                else:
-                    # Ask the user if the ID is correct
-                    usr_answer = input(f"Is the ID {raw_id} correct? (y/n): ")
-                    if usr_answer.lower() == "n":
-                        correct_id = input("Please enter the correct ID: ")
-                    else:
-                        correct_id = raw_id
-
-                    # Save the correct ID for future reference
-                    self.ID_WITH_WRONG_FORMAT[raw_id] = correct_id
-                    # Save the ID with the wrong format as a json file
-                    save_dict_as_json(
-                        self.ID_WITH_WRONG_FORMAT,
-                        path_to_ids_with_wrong_format,
-                    )
+        ids_with_wrong_format = raw_ids[has_wrong_format]
 
-                df_with_ids.loc[index, self.column_with_id] = f"{correct_id}"
+        corrected_ids = ids_with_wrong_format.map(self.ID_WITH_WRONG_FORMAT)
+        unresolved_ids = ids_with_wrong_format[corrected_ids.isna()]
+
+        if not unresolved_ids.empty and self.ask_for_unknown_ids:
+            self._ask_for_the_correct_ids(unresolved_ids.dropna().unique().tolist())
+            save_dict_as_json(self.ID_WITH_WRONG_FORMAT, self._get_path_to_ids_with_wrong_format())
+
+            corrected_ids = ids_with_wrong_format.map(self.ID_WITH_WRONG_FORMAT)
+            unresolved_ids = ids_with_wrong_format[corrected_ids.isna()]
+
+        path_to_unresolved_ids = os.path.join(
+            os.path.dirname(self.q_file_name_to_search), f"{self.q_name}_ids_unresolved.json"
+        )
+        if not unresolved_ids.empty:
+            unresolved_id_counts = unresolved_ids.astype(str).value_counts().to_dict()
+            app_logger.warning(
+                f"Questionary - {len(unresolved_id_counts)} IDs of {self.q_name} with a wrong format and no"
+                f" correction: {list(unresolved_id_counts)}"
+            )
+            save_dict_as_json(unresolved_id_counts, path_to_unresolved_ids)
+        elif os.path.exists(path_to_unresolved_ids):
+            os.remove(path_to_unresolved_ids)
+
+        # Rows are replaced by position, the index of the questionary may have duplicated labels
+        has_correction = corrected_ids.notna().to_numpy()
+        standardized_ids = raw_ids.to_numpy(dtype=object, copy=True)
+        standardized_ids[np.flatnonzero(has_wrong_format)[has_correction]] = (
+            corrected_ids[has_correction].astype(str).to_numpy()
+        )
+        df_with_ids[self.column_with_id] = standardized_ids
         return df_with_ids
 
     def _ad_hoc_cleaning(self, df_with_q: pd.DataFrame) -> pd.DataFrame:
@@ -386,8 +612,40 @@ class VisiaQuestionary(BaseQuestionary):
         df_ = self._ad_hoc_cleaning(df_)
 
         self.df_post_processed_data = df_
+        # The patient index is built on the first lookup, pipelines that join by ID never need it
+        self.invalidate_patient_index()
+
+    def _get_patient_index_key(self) -> tuple:
+        return self.df_post_processed_data, len(self.df_post_processed_data), self.column_with_id
+
+    def build_patient_index(self) -> None:
+        """
+        Index the rows of df_post_processed_data by patient, so the responses of a patient are sliced instead of
+        scanning the whole questionary. The index is rebuilt when df_post_processed_data is replaced, its number of
+        rows changes or column_with_id is renamed. Call invalidate_patient_index after modifying the IDs in place.
+        """
+        self._patient_index = self.df_post_processed_data.groupby(
+            self.column_with_id, observed=True, sort=False
+        ).indices
+        self._patient_index_key = self._get_patient_index_key()
+
+    def invalidate_patient_index(self) -> None:
+        self._patient_index = None
+        self._patient_index_key = None
+
+    def _get_patient_index(self) -> dict:
+        index_key = self._get_patient_index_key()
+        if (
+            self._patient_index is None
+            or self._patient_index_key[0] is not index_key[0]
+            or self._patient_index_key[1:] != index_key[1:]
+        ):
+            self.build_patient_index()
+        return self._patient_index
+
+    def get_patient_ids(self) -> list:
+        return list(self._get_patient_index())
 
     def get_all_the_responses_of_one_patient(self, id_patient: str):
-        return self.df_post_processed_data[
-            self.df_post_processed_data[self.column_with_id] == id_patient
-        ]
+        patient_rows = self._get_patient_index().get(id_patient, [])
+        return self.df_post_processed_data.iloc[patient_rows]
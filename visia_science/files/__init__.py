@@ -1,8 +1,13 @@
 import json
 import os
+import random
+
+import pandas as pd
 
 from visia_science import app_logger
-import random
+
+# Formats supported to save tables, and their extensions. parquet and feather need the optional pyarrow package
+SUPPORTED_TABLE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
 
 
 def is_file_a_valid_ext(path: str, extension: str = None) -> bool:
@@ -41,6 +46,91 @@ def save_dict_as_json(data: dict, path: str) -> None:
         raise RuntimeError(f"Error saving JSON file: {e}")
 
 
+def _make_object_columns_arrow_compatible(df: pd.DataFrame) -> pd.DataFrame:
+    # Arrow needs one type per column, so object columns mixing types (e.g. scores filled with "No answer") are saved
+    # as strings. Columns with a single type keep it
+    mixed_columns = [
+        column
+        for column in df.columns[df.dtypes == "object"]
+        if pd.api.types.infer_dtype(df[column], skipna=True).startswith("mixed")
+    ]
+    if not mixed_columns:
+        return df
+
+    df = df.copy(deep=False)
+    for column in mixed_columns:
+        df[column] = df[column].where(df[column].isna(), df[column].astype(str))
+    return df
+
+
+def save_dataframe(
+    df: pd.DataFrame, path_without_extension: str, output_format: str = "csv"
+) -> str:
+    """
+    Save a DataFrame as a table in the given format. CSV is kept for compatibility, parquet (snappy compressed) and
+    feather (Arrow IPC) keep the dtypes of the columns. Feather files are written uncompressed so they can be memory
+    mapped when they are loaded. The table is written to a temporary file and renamed, so a crash never leaves a
+    partial table.
+
+    Example Usage
+    -------------
+        path_to_table = save_dataframe(df, "processed/VISIA_QV_CRD", output_format="parquet")
+        df = load_dataframe(path_to_table)
+
+    :param df: The DataFrame to save. Its index is not saved
+    :param path_without_extension: The path of the table, the extension is added from the format
+    :param output_format: The format of the table, one of SUPPORTED_TABLE_FORMATS (default "csv")
+    :return: The path to the saved table
+    """
+    if output_format not in SUPPORTED_TABLE_FORMATS:
+        raise ValueError(
+            f"Format {output_format} is not supported. Supported formats are: "
+            f"{list(SUPPORTED_TABLE_FORMATS)}"
+        )
+
+    path_to_table = f"{path_without_extension}{SUPPORTED_TABLE_FORMATS[output_format]}"
+    path_to_temp_table = f"{path_to_table}.tmp"
+    if os.path.dirname(path_to_table) != "":
+        os.makedirs(os.path.dirname(path_to_table), exist_ok=True)
+
+    if output_format == "csv":
+        df.to_csv(path_to_temp_table, index=False)
+    elif output_format == "parquet":
+        _make_object_columns_arrow_compatible(df).to_parquet(path_to_temp_table, index=False)
+    else:
+        # Compressed buffers can't be memory mapped, they would be decompressed into memory when loaded
+        _make_object_columns_arrow_compatible(df).reset_index(drop=True).to_feather(
+            path_to_temp_table, compression="uncompressed"
+        )
+
+    os.replace(path_to_temp_table, path_to_table)
+    return path_to_table
+
+
+def load_dataframe(path: str, columns: list = None) -> pd.DataFrame:
+    """
+    Load a table saved with save_dataframe. The format is taken from the extension of the file.
+
+    :param path: The path to the table
+    :param columns: The columns to load. None loads all the columns
+    :return: The table as a DataFrame
+    """
+    extension = os.path.splitext(path)[1]
+    if extension not in SUPPORTED_TABLE_FORMATS.values():
+        raise ValueError(f"File {path} is not a supported table")
+
+    if extension == ".csv":
+        return pd.read_csv(path, usecols=columns)
+    if extension == ".parquet":
+        return pd.read_parquet(path, columns=columns)
+
+    from pyarrow import feather
+
+    # The uncompressed file is memory mapped instead of read, so only the pages of the requested columns are read
+    # from disk. Converting them to pandas still copies them into memory
+    return feather.read_table(path, columns=columns, memory_map=True).to_pandas()
+
+
 def scramble_file(input_path: str, output_path: str, percentage_to_scramble: float = 0.2) -> bool:
     """
     Scramble the bytes of a file to create a corrupted version.
@@ -1,25 +1,31 @@
 import os
+from typing import Union
 
 import pandas as pd
 
 from visia_science import app_logger
 from visia_science.data.patient import (
-    return_education_level,
-    return_visia_group,
-    return_sex,
-    Patient,
+    EDUCATION_NORMALIZER,
+    SEX_NORMALIZER,
+    VISIA_GROUP_NORMALIZER,
+    PatientTable,
 )
 from visia_science.data.questionary import VisiaQuestionary
-from visia_science.files import load_json_as_dict
+from visia_science.files import load_json_as_dict, save_dataframe
 
 
 def pipeline_get_visia_q(
-    q_path: str, config_path: str, q_process_path: str, q_corpus_name: str = "VISIA_Q"
+    q_path: str,
+    config_path: str,
+    q_process_path: str,
+    q_corpus_name: str = "VISIA_Q",
+    output_format: str = "csv",
+    csv_engine: str = None,
+    max_workers: int = 1,
 ) -> list:
     visia_metadata: dict = load_json_as_dict(config_path)
     visia_q_metadata = visia_metadata.get(q_corpus_name)
 
-    # Download data
     questionaries = []
     for questionary in visia_q_metadata.keys():
         q_file_to_search = os.path.join(q_path, visia_q_metadata[questionary]["q_file"])
@@ -33,10 +39,32 @@ def pipeline_get_visia_q(
             column_with_date=visia_q_metadata[questionary]["column_with_date"],
             columns_with_items=visia_q_metadata[questionary]["columns_with_items"],
             columns_with_scores=visia_q_metadata[questionary]["columns_with_scores"],
+            column_dtypes=visia_q_metadata[questionary].get("column_dtypes"),
+            output_format=output_format,
         )
-        visia_q.load_raw_data()
-        visia_q.save_q_processed()
         questionaries.append(visia_q)
+
+    # Questionaries stored in the same file load the union of their columns and dtypes, so the file is parsed once
+    columns_per_file, dtypes_per_file = {}, {}
+    for visia_q in questionaries:
+        q_file = visia_q.q_file_name_to_search
+        columns_per_file.setdefault(q_file, []).extend(visia_q.get_columns_to_keep())
+        dtypes_per_file.setdefault(q_file, {}).update(visia_q.column_dtypes or {})
+
+    # Download data
+    for visia_q in questionaries:
+        loading_arguments = {}
+        if csv_engine is not None:
+            loading_arguments["engine"] = csv_engine
+        if dtypes_per_file[visia_q.q_file_name_to_search]:
+            loading_arguments["dtype"] = dtypes_per_file[visia_q.q_file_name_to_search]
+
+        visia_q.load_raw_data(
+            loading_arguments,
+            columns_to_load=columns_per_file[visia_q.q_file_name_to_search],
+            max_workers=max_workers,
+        )
+        visia_q.save_q_processed()
     return questionaries
 
 
@@ -70,68 +98,67 @@ def pipeline_add_info_to_visia_q(visia_q: dict, columns_to_count: list = None) -
     return visia_q
 
 
-def pipeline_get_visia_patients(visia_q_with_patients: VisiaQuestionary) -> dict:
+def _ages_from_birth_dates(birth_dates: pd.Series) -> pd.Series:
+    try:
+        birth_dates = pd.to_datetime(birth_dates, dayfirst=True)
+    except ValueError:
+        # Birthdates written in different formats are parsed one by one
+        birth_dates = pd.to_datetime(birth_dates, dayfirst=True, format="mixed")
+    return ((pd.Timestamp.now() - birth_dates).dt.days // 365).astype(int)
+
+
+def pipeline_get_visia_patients(visia_q_with_patients: VisiaQuestionary) -> PatientTable:
     """
     This function processes a VisiaQuestionary object to extract patient data, calculate their age,
-    and standardize certain fields. It returns a dictionary of Patient objects.
+    and standardize certain fields. It returns a PatientTable, a mapping from patient ID to Patient.
+    All the columns are derived at once over the whole DataFrame, and the patients are validated column by column.
 
     Flow
     ----
-    1. Initialize an empty dictionary to store patient data
-    2. Iterate over each row in the post-processed DataFrame
-    3. Calculate the patient's age from their birthdate
-    4. Standardize the education level, clinical group, and biological sex fields
-    5. Create a Patient object for each row and add it to the dictionary
-    6. Save the updated DataFrame and return the dictionary of patients
+    1. Calculate the age of all the patients from their birthdates in one datetime subtraction
+    2. Standardize the education level, clinical group, and biological sex columns as categorical columns
+    3. Flag the patients with a saliva sample
+    4. Store the patients in a PatientTable indexed by patient ID
+    5. Save the updated DataFrame and return the table of patients
 
     Example Usage
     -------------
         visia_q = VisiaQuestionary(...)
-        patients_dict = pipeline_get_visia_patients(visia_q)
+        patients = pipeline_get_visia_patients(visia_q)
 
     :param visia_q_with_patients: A VisiaQuestionary object containing post-processed data
-    :return: A dictionary where keys are patient IDs and values are Patient objects
+    :return: A PatientTable where keys are patient IDs and values are Patient objects
     """
-    visia_output_patients: dict = {}
-
     df_patient: pd.DataFrame = visia_q_with_patients.df_post_processed_data
+
     # Create a new column with the age of the patient from the birth_date
-    df_patient["Edad"] = 0
-    df_patient["Edad"] = df_patient["Edad"].astype(int)
-
-    visia_q_patient: VisiaQuestionary
-    for index, row in df_patient.iterrows():
-        # Calculate age from birth_date
-        birth_date = row["Fecha de nacimiento"]
-        birth_date_obj = pd.to_datetime(birth_date, dayfirst=True)
-        age_obj = pd.Timestamp.now() - birth_date_obj
-        age = int(age_obj.days // 365)
-
-        lv_education = return_education_level(row["Nivel educativo"])
-        clinical_group = return_visia_group(row["Grupo clínico"])
-        biological_sex = return_sex(row["Sexo (biológico)"])
-        saliva_sample = True if row["Checkbox"] == "saliva" else False
-        city = row["Ciudad"]
-
-        df_patient.loc[index, "Edad"] = age
-        df_patient.loc[index, "Nivel educativo"] = lv_education
-        df_patient.loc[index, "Grupo clínico"] = clinical_group
-        df_patient.loc[index, "Sexo (biológico)"] = biological_sex
-        df_patient.loc[index, "Checkbox"] = saliva_sample
-        df_patient.loc[index, "Ciudad"] = city
-
-        visia_patient = Patient(
-            id=row[visia_q_with_patients.column_with_id],
-            age=age,
-            sex=biological_sex,
-            education_level=lv_education,
-            clinical_group=clinical_group,
-            city=city,
-            diagnosis=row["Diagnóstico"],
-            treatment=row["Tratamiento"],
-            saliva_sample=saliva_sample,
+    df_patient["Edad"] = _ages_from_birth_dates(df_patient["Fecha de nacimiento"])
+    df_patient["Nivel educativo"] = EDUCATION_NORMALIZER.normalize_series(
+        df_patient["Nivel educativo"]
+    )
+    df_patient["Grupo clínico"] = VISIA_GROUP_NORMALIZER.normalize_series(
+        df_patient["Grupo clínico"]
+    )
+    df_patient["Sexo (biológico)"] = SEX_NORMALIZER.normalize_series(
+        df_patient["Sexo (biológico)"]
+    )
+    df_patient["Checkbox"] = df_patient["Checkbox"] == "saliva"
+
+    visia_output_patients = PatientTable.from_dataframe(
+        pd.DataFrame(
+            {
+                "id": df_patient[visia_q_with_patients.column_with_id],
+                "age": df_patient["Edad"],
+                "sex": df_patient["Sexo (biológico)"],
+                "education_level": df_patient["Nivel educativo"],
+                "clinical_group": df_patient["Grupo clínico"],
+                "city": df_patient["Ciudad"],
+                "diagnosis": df_patient["Diagnóstico"],
+                "treatment": df_patient["Tratamiento"],
+                "saliva_sample": df_patient["Checkbox"],
+            }
         )
-        visia_output_patients[visia_patient.id] = visia_patient
+    )
 
     visia_q_with_patients.df_post_processed_data = df_patient
     visia_q_with_patients.save_q_processed()
@@ -139,27 +166,26 @@ def pipeline_get_visia_patients(visia_q_with_patients: VisiaQuestionary) -> dict
 
 
 def integrate_questionaries_with_patients(
-    patients_with_interest: dict, questionaries_with_interest: dict
+    patients_with_interest: Union[PatientTable, dict], questionaries_with_interest: dict
 ) -> pd.DataFrame:
     """
     This function integrates patient data with their corresponding questionnaire responses into a single DataFrame.
-    It processes each patient's data and their responses, merges them,
-    and ensures no duplicate columns while handling missing values appropriately.
+    It builds a single table with all the patients and joins the responses of each questionnaire to it by patient ID,
+    so the work grows with the number of questionnaires instead of the number of (patient, questionnaire) pairs.
+
+    Each row holds a patient with at least one response, followed by the first response of the patient to each
+    questionnaire. The columns of each questionnaire are prefixed with its name, e.g. "MFQ - Item 1".
 
     Flow
     ----
-    1. Initialize empty lists and DataFrames for storing patient responses.
-    2. Iterate over each patient and convert their data to a DataFrame.
-    3. For each questionnaire, get the patient's responses, drop unnecessary columns, and merge with patient data.
-    4. Concatenate all responses for each patient into a single DataFrame.
-    5. Remove duplicate columns and handle missing values.
+    1. Build a DataFrame with the data of all the patients, indexed by patient ID.
+    2. For each questionnaire, keep the first response of each patient, drop the ID column and prefix the columns.
+    3. Join the responses of all the questionnaires to the patients in a single keyed join.
+    4. Keep the patients with at least one response, remove duplicate columns and handle missing values.
 
     Example Usage
     -------------
-        patients = {
-            "patient_1": Patient(...),
-            "patient_2": Patient(...)
-        }
+        patients = pipeline_get_visia_patients(VisiaQuestionary(...))
         questionaries = {
             "questionary_1": VisiaQuestionary(...),
             "questionary_2": VisiaQuestionary(...)
@@ -167,65 +193,70 @@ def integrate_questionaries_with_patients(
         result_df = integrate_questionaries_with_patients(patients, questionaries)
         print(result_df)
 
-    :param patients_with_interest: A dict where keys are patient IDs and values are patient objects
+    :param patients_with_interest: A PatientTable, or a dict where keys are patient IDs and values are Patient objects
     :param questionaries_with_interest:  A dict where keys are questionnaire names and values are questionnaire objects
     :return: Returns a DataFrame containing integrated patient data and their questionnaire responses
     """
-    patient_with_all_responses, df_patient_with_all_responses = [], pd.DataFrame()
-    for patient_id, patient_object in patients_with_interest.items():
-        # Patient data as DataFrame
-        df_with_patients = pd.DataFrame(patient_object.model_dump(), index=[0])
-
-        # Get all the responses of the patient as DataFrame
-        q_responses_of_a_patient, df_q_responses_of_a_patient = [], pd.DataFrame()
-        for questionary_name, questionary_obj in questionaries_with_interest.items():
-            q_response_of_patient: pd.DataFrame = (
-                questionary_obj.get_all_the_responses_of_one_patient(patient_id)
-            )
-
-            # Drop columns that are not needed id
-            q_response_of_patient = q_response_of_patient.drop(
-                columns=[questionary_obj.column_with_id]
-            )
-
-            # Add q-name to each column
-            q_response_of_patient.columns = [
-                f"{questionary_name} - {column}" for column in q_response_of_patient.columns
-            ]
-
-            # Add to each row the df_patient
-            q_response_of_patient.reset_index(drop=True, inplace=True)
-            q_response_of_patient = pd.merge(
-                df_with_patients, q_response_of_patient, left_index=True, right_index=True
-            )
-            q_responses_of_a_patient.append(q_response_of_patient)
-
-        # Concatenate all the responses of the patient into a single DataFrame
-        df_q_responses_of_a_patient = pd.concat(q_responses_of_a_patient, axis=1)
-        df_q_responses_of_a_patient.reset_index(drop=True, inplace=True)
-        patient_with_all_responses.append(df_q_responses_of_a_patient)
-
-    df_patient_with_all_responses = pd.concat(patient_with_all_responses, ignore_index=True)
+    # Patient data as DataFrame, the columns of a PatientTable are exported without copies nor validation
+    if not isinstance(patients_with_interest, PatientTable):
+        patients_with_interest = PatientTable.from_patients(patients_with_interest.values())
+    df_patients = patients_with_interest.to_dataframe()
+
+    # First response of each patient to each questionary, indexed by patient ID
+    q_first_responses = []
+    for questionary_name, questionary_obj in questionaries_with_interest.items():
+        df_q_first_responses = questionary_obj.df_post_processed_data.drop_duplicates(
+            subset=questionary_obj.column_with_id, keep="first"
+        ).set_index(questionary_obj.column_with_id)
+        # Responses of unknown patients would add rows to the join and upcast the patient columns
+        df_q_first_responses = df_q_first_responses[
+            df_q_first_responses.index.isin(df_patients.index)
+        ]
+
+        # Add q-name to each column
+        df_q_first_responses.columns = [
+            f"{questionary_name} - {column}" for column in df_q_first_responses.columns
+        ]
+        q_first_responses.append(df_q_first_responses)
+
+    # Join all the questionaries at once, only patients with some response are kept
+    patients_with_responses = df_patients.index.isin(
+        pd.Index([]).append([df_q.index for df_q in q_first_responses])
+    )
+    df_patient_with_all_responses = (
+        df_patients[patients_with_responses]
+        .join(q_first_responses, how="left")
+        .reset_index(drop=True)
+    )
 
     # Remove all the duplicated columns
     df_patient_with_all_responses = df_patient_with_all_responses.loc[
         :, ~df_patient_with_all_responses.columns.duplicated()
     ]
 
-    # Replace all the NaN values in a string column with "No answer"
-    for column in df_patient_with_all_responses.columns:
-        if df_patient_with_all_responses[column].dtype in ["object", "string"]:
-            df_patient_with_all_responses[column] = df_patient_with_all_responses[column].fillna(
-                "No answer"
-            )
-        elif df_patient_with_all_responses[column].dtype in ["int", "float"]:
-            df_patient_with_all_responses[column] = df_patient_with_all_responses[column].fillna(0)
+    # Replace all the NaN values in a string column with "No answer", in a numeric column with 0 and with "UNK" in
+    # any other column
+    fill_values = {}
+    for column in df_patient_with_all_responses.columns[
+        df_patient_with_all_responses.isna().any()
+    ]:
+        column_dtype = df_patient_with_all_responses[column].dtype
+        # A categorical column is filled as a column of its categories
+        is_categorical = isinstance(column_dtype, pd.CategoricalDtype)
+        values_dtype = column_dtype.categories.dtype if is_categorical else column_dtype
+        if values_dtype in ["object", "string"]:
+            fill_values[column] = "No answer"
+        elif values_dtype in ["int", "float"]:
+            fill_values[column] = 0
         else:
-            df_patient_with_all_responses[column] = df_patient_with_all_responses[column].fillna(
-                "UNK"
-            )
+            fill_values[column] = "UNK"
 
-    return df_patient_with_all_responses
+        if is_categorical and fill_values[column] not in column_dtype.categories:
+            df_patient_with_all_responses[column] = df_patient_with_all_responses[
+                column
+            ].cat.add_categories([fill_values[column]])
+
+    return df_patient_with_all_responses.fillna(fill_values)
 
 
 def visia_questionaries_pipeline(
@@ -234,11 +265,14 @@ def visia_questionaries_pipeline(
     config_path: str,
     q_process_path: str,
     q_corpus_name: str = "VISIA_Q",
+    output_format: str = "csv",
+    csv_engine: str = None,
+    max_workers: int = 1,
 ) -> pd.DataFrame:
     """
     This function orchestrates the entire pipeline for processing Visia questionaries.
     It downloads, cleans, and enriches the questionaries, extracts patient data, and integrates the questionaries with
-     patient information, saving the final dataset to a CSV file.
+     patient information, saving the final dataset to a table (CSV by default).
 
     Flow
     ----
@@ -246,7 +280,7 @@ def visia_questionaries_pipeline(
     2. Cleans the questionaries using pipeline_clean_visia_q.
     3. Adds additional information to the questionaries with pipeline_add_info_to_visia_q.
     4. Extracts patient data from the questionaries using pipeline_get_visia_patients.
-    5. Integrates the questionaries with patient data and saves the result to a CSV file.
+    5. Integrates the questionaries with patient data and saves the result to a table.
 
     :param exp_name: The name of the experiment
     :param q_path: The path where the raw questionaries are stored
@@ -273,13 +307,21 @@ def visia_questionaries_pipeline(
                         [
                             "Score1",
                             "Body Mass Index",
-                        ]
+                        ],
+                    "column_dtypes":
+                        {
+                            "Sex": "category",
+                            "Score1": "float",
+                        },
                     "q_url": "https://url_to_questionary_file
                 }
             }
         }
     :param q_process_path: The path where processed questionaries will be saved.
     :param q_corpus_name: The name of the questionaries corpus in the configuration file.
+    :param output_format: The format of the processed tables, one of "csv", "parquet" or "feather" (default "csv").
+    :param csv_engine: The pd.read_csv engine used to parse the questionaries, e.g. "pyarrow" (default pandas').
+    :param max_workers: The number of threads that read the files of a questionary at once (default 1).
     :return: a df containing the integrated questionaries and patient data.
     """
     try:
@@ -289,6 +331,9 @@ def visia_questionaries_pipeline(
             config_path=config_path,
             q_process_path=q_process_path,
             q_corpus_name=q_corpus_name,
+            output_format=output_format,
+            csv_engine=csv_engine,
+            max_workers=max_workers,
         )
         # Clean questionaries
         visia_questionaries: dict = pipeline_clean_visia_q(visia_questionaries)
@@ -296,14 +341,17 @@ def visia_questionaries_pipeline(
         visia_questionaries: dict = pipeline_add_info_to_visia_q(visia_questionaries)
         # Get patients
         visia_q_patients: VisiaQuestionary = visia_questionaries.pop("VSC")
-        visia_all_patients: dict = pipeline_get_visia_patients(visia_q_patients)
+        visia_all_patients: PatientTable = pipeline_get_visia_patients(visia_q_patients)
         # Integrate questionaries with patients
         visia_patient_with_all_responses = integrate_questionaries_with_patients(
             visia_all_patients, visia_questionaries
         )
         # Save the processed questionaries
-        path_to_save = os.path.join(q_process_path, f"{exp_name}_Q_CRDs.csv")
-        visia_patient_with_all_responses.to_csv(path_to_save, index=False)
+        save_dataframe(
+            visia_patient_with_all_responses,
+            os.path.join(q_process_path, f"{exp_name}_Q_CRDs"),
+            output_format=output_format,
+        )
 
         app_logger.info(f"Pipeline finished for {exp_name}")
     except Exception as e:
@@ -1,67 +1,383 @@
+import asyncio
 import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Callable, Dict, List, Optional
 
 import pandas as pd
 
 from visia_science import app_logger
-from visia_science.data.multimedia import Multimedia
-from visia_science.responses.http import BasicResponse
+from visia_science.data.multimedia import (
+    Multimedia,
+    get_whisper_model_name,
+    probe_media_batch_async,
+)
+from visia_science.data.multimedia_index import (
+    MetadataCheckpoint,
+    MultimediaMetadataIndex,
+)
+from visia_science.files import save_dataframe
 
 
-def pipeline_videos(path_to_raw_video: str, path_to_save_processed_video: str):
+def process_video_file(
+    video_file_path: str,
+    path_to_save_processed_video: str,
+    whisper_model_name: str = None,
+    path_to_transcription_cache: str = None,
+    transcribe: bool = False,
+) -> Optional[dict]:
+    """
+    Extract the metadata of a single video file. It is a module-level function so it can be sent to a process pool.
+
+    :param video_file_path: The path to the video file
+    :param path_to_save_processed_video: The directory path where processed video metadata will be saved
+    :param whisper_model_name: The whisper model used to transcribe the video (default depends on the language)
+    :param path_to_transcription_cache: SQLite file where transcriptions are cached. None disables the cache
+    :param transcribe: Whether to add the whisper transcription of the video to its metadata
+    :return: The metadata of the video as a dict, or None if the file couldn't be loaded
+    """
+    visia_video = Multimedia(
+        path_to_raw_data=video_file_path,
+        path_to_save_data=path_to_save_processed_video,
+        whisper_model_name=whisper_model_name,
+        path_to_transcription_cache=path_to_transcription_cache,
+    )
+
+    multimedia_metadata = visia_video.get_metadata()
+    app_logger.info(f"Video Pipeline - GetMetadata - Success: {multimedia_metadata is not None}")
+
+    if transcribe and multimedia_metadata is not None:
+        transcription_response = visia_video.transcribe()
+        transcription_response.log_response(module="Video Pipeline", action="Transcribe")
+
+    return multimedia_metadata
+
+
+def _is_metadata_reusable(
+    multimedia_metadata: dict, transcribe: bool, whisper_model_name: str = None
+) -> bool:
+    # process_video_file transcribes with the default language of Multimedia.transcribe
+    if not transcribe:
+        return True
+    return multimedia_metadata.get("transcription_model") == get_whisper_model_name(
+        whisper_model_name, "es"
+    )
+
+
+def build_metadata_dataframe(metadata_records: List[dict]) -> pd.DataFrame:
+    """
+    Build the metadata DataFrame of many videos at once from their metadata records. Columns follow the order in which
+    they first appear in the records, and an empty record gives a row of empty values.
+
+    :param metadata_records: The metadata of each video as a dict
+    :return: A DataFrame with a row per record
+    """
+    if not metadata_records:
+        return pd.DataFrame()
+    return pd.DataFrame.from_records(metadata_records)
+
+
+def process_videos_in_pool(
+    pending_videos: deque,
+    workers: int,
+    max_tasks_in_flight: int,
+    collect_video_result: Callable,
+    path_to_save_processed_video: str,
+    whisper_model_name: str = None,
+    path_to_transcription_cache: str = None,
+    transcribe: bool = False,
+) -> Dict[str, Future]:
+    """
+    Process the pending video files in a pool of worker processes, with at most max_tasks_in_flight files submitted
+    at once, and pass the result of each file to collect_video_result as it finishes. Processed files are removed from
+    pending_videos.
+
+    If a worker dies (e.g. killed by the OOM killer or by a crash of a native decoder) the pool breaks, and every file
+    in flight fails with it. Those files are not collected, the function stops and returns them, so the caller can
+    retry them and go on with the rest of pending_videos in a new pool.
+
+    :param pending_videos: The paths of the video files to process
+    :param workers: The number of worker processes
+    :param max_tasks_in_flight: The maximum number of files submitted to the pool at once
+    :param collect_video_result: Called with the path of each file and a callable that returns its metadata
+    :param path_to_save_processed_video: The directory path where processed video metadata will be saved
+    :param whisper_model_name: The whisper model used to transcribe the videos (default depends on the language)
+    :param path_to_transcription_cache: SQLite file where transcriptions are cached. None disables the cache
+    :param transcribe: Whether to add the whisper transcription of each video to its metadata
+    :return: The files that were in flight when the pool broke, with their futures
+    """
+    futures_in_flight: dict = {}
+    videos_in_broken_pool: dict = {}
+    number_of_pending_videos = len(pending_videos)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+
+        def submit_next_video() -> None:
+            if pending_videos and not videos_in_broken_pool:
+                future = executor.submit(
+                    process_video_file,
+                    pending_videos[0],
+                    path_to_save_processed_video,
+                    whisper_model_name,
+                    path_to_transcription_cache,
+                    transcribe,
+                )
+                # The file is only taken from the queue once it is submitted
+                futures_in_flight[future] = pending_videos.popleft()
+
+        def collect_done_video(future: Future) -> None:
+            video_file_path = futures_in_flight.pop(future)
+            if isinstance(future.exception(), BrokenProcessPool):
+                videos_in_broken_pool[video_file_path] = future
+            else:
+                collect_video_result(video_file_path, future.result)
+
+        try:
+            for _ in range(max_tasks_in_flight):
+                submit_next_video()
+
+            while futures_in_flight:
+                done_futures, _ = wait(futures_in_flight, return_when=FIRST_COMPLETED)
+                for future in done_futures:
+                    collect_done_video(future)
+                    submit_next_video()
+        except BrokenProcessPool as e:
+            if len(pending_videos) == number_of_pending_videos:
+                # The pool broke before taking any file, a new pool would break again
+                raise
+            # The pool broke while a file was submitted, the files in flight finish with it
+            app_logger.error(f"Worker pool broken while submitting a video: {e}")
+            wait(futures_in_flight)
+            for future in list(futures_in_flight):
+                collect_done_video(future)
+
+    if videos_in_broken_pool:
+        app_logger.error(f"Worker pool broken with {len(videos_in_broken_pool)} videos in flight")
+    return videos_in_broken_pool
+
+
+def pipeline_videos(
+    path_to_raw_video: str,
+    path_to_save_processed_video: str,
+    use_index: bool = True,
+    workers: int = 1,
+    max_tasks_in_flight: int = None,
+    whisper_model_name: str = None,
+    transcribe: bool = False,
+    checkpoint_every: int = 50,
+    output_format: str = "csv",
+):
     """
     This function processes all video files in a specified directory, extracts their metadata,
-    and saves the combined metadata to a CSV file.
+    and saves the combined metadata to a table (CSV by default).
 
     Important Cases:
      1. Corrupted Video Files: If the video file is empty, the function will insert a row with the video file path with
       the metadata available, the confidence, and video/audio duration as 0.
+     2. Already Processed Files: If use_index is True, the metadata of each processed file is stored in
+      metadata_all_videos.sqlite next to the CSV file. Files that didn't change since the last run are not processed
+      again, their metadata is taken from the index. If transcribe is True, only the metadata with a transcription of
+      the same whisper model is taken from the index or the checkpoint, the other files are processed again.
+     3. Parallel Processing: If workers > 1, the video files are processed in a pool of worker processes. At most
+      max_tasks_in_flight files are submitted to the pool at the same time. The rows are always sorted by file name,
+      whatever the order in which the workers finish. If a worker dies, the files in flight are retried one at a time
+      in a new pool, only a file that kills a worker on its own is failed, and the rest of the files are processed in
+      a new pool.
+     4. Crashes: Every checkpoint_every processed files, their metadata is appended to
+      metadata_all_videos.checkpoint.jsonl. If the run crashes, the next run resumes from the last checkpointed file.
+      The checkpoint is flushed even if the run is interrupted, and removed once the table is saved.
+     5. Transcriptions: If transcribe is True, each file is transcribed with whisper_model_name. Whisper results are
+      cached in transcriptions.sqlite next to the CSV file, keyed by the audio of each file, the model and the
+      language, so they are not computed again if the audio didn't change.
 
     Flow
     ----
     1. Initialize an empty DataFrame to store metadata for all videos.
-    2. Iterate over each video file in the specified raw video directory.
-    3. Create a Multimedia object for each video file.
-    4. Extract metadata and log the response.
-    5. Concatenate the metadata of each video to the main DataFrame.
-    6. Save the combined metadata to a CSV file.
+    2. Iterate over each video file in the specified raw video directory, sorted by name.
+    3. Reuse the indexed metadata of the file if it didn't change since the last run.
+    4. Otherwise, create a Multimedia object for the video file, extract its metadata and log the response.
+    5. Build a single DataFrame from the metadata records of all videos.
+    6. Save the combined metadata to a table in the output format, through a temporary file renamed atomically.
 
     :param path_to_raw_video: The directory path containing raw video files
     :param path_to_save_processed_video: The directory path where processed video metadata will be saved
+    :param use_index: Whether to reuse the metadata of files processed in previous runs
+    :param workers: The number of worker processes. 1 processes the files in the current process
+    :param max_tasks_in_flight: The maximum number of files submitted to the pool at once (default 2 * workers)
+    :param whisper_model_name: The whisper model used to transcribe the videos (default depends on the language)
+    :param transcribe: Whether to add the whisper transcription of each video to its metadata (default False)
+    :param checkpoint_every: The number of processed files appended to the checkpoint at once
+    :param output_format: The format of metadata_all_videos, one of "csv", "parquet" or "feather" (default "csv")
     :return: A DataFrame containing metadata for all processed videos
     """
-    df_metadata_all_videos = pd.DataFrame()
+    metadata_per_video: dict = {}
+    path_to_transcription_cache = os.path.join(
+        path_to_save_processed_video, "transcriptions.sqlite"
+    )
 
-    for video_file_path in os.listdir(path_to_raw_video):
-        video_file_path = os.path.join(path_to_raw_video, video_file_path)
-        visia_video = Multimedia(
-            path_to_raw_data=video_file_path, path_to_save_data=path_to_save_processed_video
+    checkpoint = MetadataCheckpoint(
+        os.path.join(path_to_save_processed_video, "metadata_all_videos.checkpoint.jsonl"),
+        batch_size=checkpoint_every,
+    )
+    checkpoint_records = checkpoint.load_records()
+
+    metadata_index = None
+    if use_index:
+        metadata_index = MultimediaMetadataIndex(
+            os.path.join(path_to_save_processed_video, "metadata_all_videos.sqlite")
         )
 
-        try:
-            metadata_video: BasicResponse = visia_video.get_metadata_as_dataframe()
-            metadata_video.log_response("Video Pipeline", "GetMetadata")
+    video_file_paths = [
+        os.path.join(path_to_raw_video, video_file_name)
+        for video_file_name in sorted(os.listdir(path_to_raw_video))
+    ]
+
+    videos_to_process = []
+    for video_file_path in video_file_paths:
+        checkpoint_record = checkpoint_records.get(video_file_path)
+        if checkpoint_record is not None and _is_metadata_reusable(
+            checkpoint_record, transcribe, whisper_model_name
+        ):
+            metadata_per_video[video_file_path] = checkpoint_record
+            continue
 
-            metadata_video_df = metadata_video.data
+        if metadata_index is not None:
+            indexed_metadata = metadata_index.get_metadata(video_file_path)
+            if indexed_metadata is not None and _is_metadata_reusable(
+                indexed_metadata, transcribe, whisper_model_name
+            ):
+                app_logger.info(f"Video {video_file_path} found in the metadata index")
+                metadata_per_video[video_file_path] = indexed_metadata
+                continue
+
+        videos_to_process.append(video_file_path)
+
+    def collect_video_result(video_file_path: str, get_result: Callable) -> None:
+        try:
+            multimedia_metadata = get_result()
             app_logger.info(f"Video {video_file_path} processed successfully")
 
-            # Concatenate with all metadata
-            df_metadata_all_videos = pd.concat([df_metadata_all_videos, metadata_video_df])
+            # Files that couldn't be loaded are kept as an empty row
+            metadata_per_video[video_file_path] = multimedia_metadata or {}
+            checkpoint.add_record(video_file_path, metadata_per_video[video_file_path])
+
+            if metadata_index is not None and multimedia_metadata is not None:
+                metadata_index.set_metadata(video_file_path, multimedia_metadata)
         except Exception as e:
             app_logger.error(f"Error processing video {video_file_path}: {e}")
 
-        # Clean Up
-        del visia_video
+    try:
+        if workers > 1:
+            if max_tasks_in_flight is None:
+                max_tasks_in_flight = 2 * workers
 
-    # Save the metadata of all videos to a CSV file
-    os.makedirs(path_to_save_processed_video, exist_ok=True)
-    df_metadata_all_videos.to_csv(
-        os.path.join(path_to_save_processed_video, "metadata_all_videos.csv"), index=False
+            app_logger.info(f"Processing {len(videos_to_process)} videos with {workers} workers")
+            pool_args = (
+                collect_video_result,
+                path_to_save_processed_video,
+                whisper_model_name,
+                path_to_transcription_cache,
+                transcribe,
+            )
+            pending_videos = deque(videos_to_process)
+            while pending_videos:
+                videos_in_broken_pool = deque(
+                    process_videos_in_pool(
+                        pending_videos, workers, max_tasks_in_flight, *pool_args
+                    )
+                )
+                # Retry the files of a broken pool one at a time, so only a file that breaks a pool on its own fails
+                while videos_in_broken_pool:
+                    for video_file_path, future in process_videos_in_pool(
+                        videos_in_broken_pool, 1, 1, *pool_args
+                    ).items():
+                        collect_video_result(video_file_path, future.result)
+        else:
+            for video_file_path in videos_to_process:
+                collect_video_result(
+                    video_file_path,
+                    lambda: process_video_file(
+                        video_file_path,
+                        path_to_save_processed_video,
+                        whisper_model_name,
+                        path_to_transcription_cache,
+                        transcribe,
+                    ),
+                )
+    finally:
+        # Keep the buffered records of the checkpoint even if the run is interrupted
+        if metadata_index is not None:
+            metadata_index.close()
+        checkpoint.flush()
+
+    # Build the metadata of all videos following the order of the files
+    df_metadata_all_videos = build_metadata_dataframe(
+        [
+            metadata_per_video[video_file_path]
+            for video_file_path in video_file_paths
+            if video_file_path in metadata_per_video
+        ]
+    )
+
+    # Save the metadata of all videos, a crash while writing it keeps the previous table
+    save_dataframe(
+        df_metadata_all_videos,
+        os.path.join(path_to_save_processed_video, "metadata_all_videos"),
+        output_format=output_format,
     )
+
+    checkpoint.remove()
     return df_metadata_all_videos
 
 
+def pipeline_scan_videos_metadata(
+    path_to_raw_video: str, path_to_save_processed_video: str, max_concurrent_probes: int = 32
+) -> pd.DataFrame:
+    """
+    This function scans the metadata of all video files in a specified directory. It returns the same DataFrame as
+    pipeline_videos, but the files are probed concurrently, with up to max_concurrent_probes ffprobe processes at once,
+    and nothing is saved. It is meant for inventories of large directories, where ffprobe latency dominates.
+
+    It uses asyncio.run, so it can't be called from a running event loop (e.g. a notebook cell with await).
+
+    Flow
+    ----
+    1. List the video files in the specified raw video directory, sorted by name.
+    2. Probe all the files concurrently with asyncio subprocesses. The results are kept in the probe cache.
+    3. Standardize the metadata of each file from its cached probe, as pipeline_videos does.
+    4. Build a single DataFrame from the metadata records of all videos.
+
+    :param path_to_raw_video: The directory path containing raw video files
+    :param path_to_save_processed_video: The directory path where processed video metadata would be saved
+    :param max_concurrent_probes: The maximum number of ffprobe processes running at once
+    :return: A DataFrame containing metadata for all scanned videos
+    """
+    video_file_paths = [
+        os.path.join(path_to_raw_video, video_file_name)
+        for video_file_name in sorted(os.listdir(path_to_raw_video))
+    ]
+
+    app_logger.info(
+        f"Probing {len(video_file_paths)} videos with up to {max_concurrent_probes} processes"
+    )
+    asyncio.run(probe_media_batch_async(video_file_paths, max_concurrent_probes))
+
+    metadata_records = []
+    for video_file_path in video_file_paths:
+        try:
+            multimedia_metadata = process_video_file(video_file_path, path_to_save_processed_video)
+            metadata_records.append(multimedia_metadata or {})
+        except Exception as e:
+            app_logger.error(f"Error processing video {video_file_path}: {e}")
+
+    return build_metadata_dataframe(metadata_records)
+
+
 def merge_processed_qv(
-    processed_q: pd.DataFrame, processed_v: pd.DataFrame, path_to_save: str
+    processed_q: pd.DataFrame,
+    processed_v: pd.DataFrame,
+    path_to_save: str,
+    output_format: str = "csv",
 ) -> pd.DataFrame:
     """
     This function merges the processed questionaries and videos DataFrames, calculates the number of videos, and the
@@ -71,11 +387,12 @@ def merge_processed_qv(
     ----
     1. Calculate the number of videos for each questionary.
     2. Calculate the total duration of videos for each questionary.
-    3. Save the merged DataFrame to a CSV file.
+    3. Save the merged DataFrame to a table (CSV by default).
 
     :param processed_q: The processed questionaries DataFrame
     :param processed_v: The processed videos DataFrame
     :param path_to_save: The directory path where the merged DataFrame will be saved
+    :param output_format: The format of VISIA_QV_CRD, one of "csv", "parquet" or "feather" (default "csv")
     :return: The merged DataFrame
     """
     # Get only videos with valid audio-duration and with ffmpeg_confidence > 0.5
@@ -93,5 +410,7 @@ def merge_processed_qv(
         .fillna(0)
     )
 
-    processed_q.to_csv(os.path.join(path_to_save, "VISIA_QV_CRD.csv"), index=False)
+    save_dataframe(
+        processed_q, os.path.join(path_to_save, "VISIA_QV_CRD"), output_format=output_format
+    )
     return processed_q